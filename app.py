@@ -1,21 +1,50 @@
 import os
+import uuid
 import traceback
 import threading
 import time
-from flask import Flask, request, jsonify
+import multiprocessing
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import numpy as np
 
-from config import UPLOAD_FOLDER, MAX_CONTENT_LENGTH, AWS_URL, BASE_URL, PRODUCTS_EXCEL_KEY
+from config import (
+    UPLOAD_FOLDER,
+    SAVE_UPLOADS,
+    MAX_CONTENT_LENGTH,
+    MAX_BATCH_QUERIES,
+    PRODUCTS_EXCEL_KEY,
+    WARMUP_ON_START,
+    SLOW_REQUEST_PROFILE_MS,
+    PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_DIR,
+    INDEX_BUILD_IN_SUBPROCESS,
+)
 from utils import allowed_file
 from image_matcher import (
-    find_best_matches,
-    build_image_index,
-    list_images,
-    load_product_mapping,
-    get_product_info_for_filename
+    feature_batcher,
+    image_query_cache,
+    image_records,
+    find_best_match_rows,
+    find_best_match_rows_batch,
+    get_image_index,
+    update_image_index,
+)
+from clip_matcher import (
+    clip_records,
+    get_clip_index,
+    search_tile_rows_by_text,
+    search_tile_rows_by_text_batch,
+    text_batcher,
+    text_embedding_cache,
 )
+from product_mapping import load_product_mapping
+from reindex import run_in_subprocess
+from image_cache import get_image_cache
+from profiler import SlowRequestProfiler
+from worker_pool import InferencePoolBusy, get_inference_pool
+import metrics
+import warmup
 
 app = Flask(__name__)
 CORS(app)  # Allow CORS for all routes
@@ -24,63 +53,104 @@ CORS(app)  # Allow CORS for all routes
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Ensure upload folder exists
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-# Load product mapping at startup (cached)
-try:
-    load_product_mapping(force=True)
-except Exception as e:
-    print(f"⚠️ Could not pre-load product mapping: {e}")
-
-# -----------------------
-# 🔹 Helper: Convert numpy to Python types
-# -----------------------
-def convert_numpy(obj):
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.generic):
-        return obj.item()
-    elif isinstance(obj, float):
-        return float(obj)
-    elif isinstance(obj, list):
-        return [convert_numpy(i) for i in obj]
-    elif isinstance(obj, tuple):
-        return tuple(convert_numpy(i) for i in obj)
-    elif isinstance(obj, dict):
-        return {k: convert_numpy(v) for k, v in obj.items()}
-    else:
-        return obj
+# Uploads are processed in memory; the folder is only needed for debug copies
+if SAVE_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# -----------------------
+# 🔹 Request timing / slow-request profiling
+# -----------------------
+profiler = SlowRequestProfiler(SLOW_REQUEST_PROFILE_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_DIR) if SLOW_REQUEST_PROFILE_MS > 0 else None
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler is not None:
+        profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_latency.observe(elapsed, endpoint=endpoint, method=request.method)
+        metrics.requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if profiler is not None:
+            profiler.stop(elapsed, f"{request.method} {endpoint}")
+    return response
+
+@app.teardown_request
+def discard_request_profile(exc):
+    # after_request is skipped when a request fails with an unhandled error
+    if profiler is not None:
+        profiler.discard()
 
 # -----------------------
 # 🔹 Background Index & Excel Watcher
 # -----------------------
 def watch_s3_inventory(interval=300):
-    """Check S3 inventory and product excel periodically and rebuild index/mapping if changed."""
-    last_seen = set()
-
+    """Check S3 inventory and product excel periodically and update index/mapping if changed."""
     while True:
         try:
-            current = set([key for _, key in list_images()])
-            if current != last_seen:
-                print("🔄 S3 inventory changed → rebuilding index...")
-                build_image_index()
-                last_seen = current
+            # Only new/changed (by ETag) images are embedded; deleted ones are dropped.
+            # The build runs in a low-priority child process and publishes a new
+            # index version that request threads pick up on their next query.
+            updated = run_in_subprocess() if INDEX_BUILD_IN_SUBPROCESS else update_image_index()
+            if updated:
+                print("🔄 S3 inventory changed → index updated")
         except Exception as e:
             print(f"⚠️ Error watching inventory: {e}")
 
         # Try reload product mapping (image->product) every interval
         try:
-            # load_product_mapping handles caching and only reloads if modified
+            # conditional GET: only re-downloads and re-parses if the ETag changed
             load_product_mapping()
         except Exception as e:
             print(f"⚠️ Error reloading product mapping: {e}")
 
+        try:
+            # Rebuild response records here if the index or mapping changed, not on a request
+            image_records.refresh(get_image_index())
+            clip_records.refresh(get_clip_index())
+        except Exception as e:
+            print(f"⚠️ Error refreshing response records: {e}")
+
         time.sleep(interval)  # check every `interval` seconds
 
-# Start watcher thread
-watcher_thread = threading.Thread(target=watch_s3_inventory, daemon=True)
-watcher_thread.start()
+def start_watcher():
+    watcher_thread = threading.Thread(target=watch_s3_inventory, name="s3-watcher", daemon=True)
+    watcher_thread.start()
+    return watcher_thread
+
+def start_background_tasks():
+    """
+    Warm up (S3, product mapping, models, indexes) in the background so the
+    process binds its port immediately; the watcher starts once warm-up is done.
+    """
+    if WARMUP_ON_START:
+        warmup.start_warmup(then=start_watcher)
+    else:
+        warmup.mark_ready()
+        start_watcher()
+
+# Inference pool workers are spawned and re-import the launching script (as
+# __mp_main__ under `python app.py`); only the serving process warms up and
+# watches S3, a worker would otherwise run its own builds and a nested pool
+if multiprocessing.parent_process() is None:
+    start_background_tasks()
+
+# -----------------------
+# 🔹 API: Liveness / readiness
+# -----------------------
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = warmup.status()
+    return jsonify(status), (200 if status["ready"] else 503)
 
 # -----------------------
 # 🔹 API: Upload image
@@ -95,57 +165,61 @@ def upload_image():
         if not allowed_file(file.filename):
             return jsonify({"error": "File type not allowed"}), 400
 
-        # Clear existing uploaded files
-        for f in os.listdir(UPLOAD_FOLDER):
-            try:
-                os.remove(os.path.join(UPLOAD_FOLDER, f))
-            except Exception:
-                pass
-
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-
-        if not os.path.exists(filepath):
-            return jsonify({"error": "Failed to save uploaded image"}), 500
-
-        matches = find_best_matches(filepath)
-        safe_matches = convert_numpy(matches)
-
-        transformed_matches = []
-        for match in safe_matches:
-            # match: (s3_key, score)
-            key = match[0]
-            score = float(match[1]) if len(match) >= 2 else 0.0
-            basename = os.path.basename(key)
-
-            # product info from excel mapping (now returns title, slug, sizes, category)
-            product_title, product_slug, sizes, category = get_product_info_for_filename(basename)
-
-            product_url = None
-            if product_slug:
-                product_url = f"{BASE_URL.rstrip('/')}/products/{product_slug.lstrip('/')}"
-
-            transformed_matches.append({
-                "url": f"{AWS_URL}/{key}",
-                "score": score,
-                "filename": os.path.basename(key),
-                "productName": product_title if product_title else None,
-                "productUrl": product_url,
-                "sizes": sizes if sizes else "",
-                "category": category if category else ""
-            })
-
-        return jsonify({"results": transformed_matches})
+        image_bytes = file.read()
+        if not image_bytes:
+            return jsonify({"error": "Empty image"}), 400
+
+        if SAVE_UPLOADS:
+            # Debug copy only; unique name so concurrent requests never collide
+            filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+            with metrics.span("upload.save"), open(os.path.join(UPLOAD_FOLDER, filename), "wb") as f:
+                f.write(image_bytes)
+
+        index, matches = find_best_match_rows(image_bytes)
+        with metrics.span("image.records"):
+            results = image_records.gather(index, matches)
+        return jsonify({"results": results})
+    except InferencePoolBusy:
+        return jsonify({"error": "Server busy, retry shortly"}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
 # -----------------------
-# 🔹 API: Search by text
+# 🔹 API: Upload many images
 # -----------------------
-from clip_matcher import search_tiles_by_text
+@app.route('/upload/batch', methods=['POST'])
+def upload_images_batch():
+    try:
+        files = [f for f in request.files.getlist('images') if f.filename]
+        if not files:
+            return jsonify({"error": "No images provided"}), 400
+        if len(files) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"At most {MAX_BATCH_QUERIES} images per request"}), 400
+
+        entries = []
+        for file in files:
+            if not allowed_file(file.filename):
+                entries.append({"filename": file.filename, "error": "File type not allowed"})
+            else:
+                entries.append({"filename": file.filename, "data": file.read()})
+
+        queries = [entry for entry in entries if "data" in entry]
+        index, all_matches = find_best_match_rows_batch([entry.pop("data") for entry in queries])
+        with metrics.span("image.records"):
+            for entry, matches in zip(queries, all_matches):
+                entry["results"] = image_records.gather(index, matches)
+
+        return jsonify({"results": entries})
+    except InferencePoolBusy:
+        return jsonify({"error": "Server busy, retry shortly"}), 503
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
+# -----------------------
+# 🔹 API: Search by text
+# -----------------------
 @app.route('/search', methods=['POST'])
 def search_by_text():
     try:
@@ -154,31 +228,67 @@ def search_by_text():
         if not description:
             return jsonify({"error": "Description is required"}), 400
 
-        matches = search_tiles_by_text(description)
-        safe_matches = convert_numpy(matches)
-
-        transformed_matches = []
-        for match in safe_matches:
-            key = match[0]
-            score = float(match[1]) if len(match) >= 2 else 0.0
-            basename = os.path.basename(key)
-            product_title, product_slug, sizes, category = get_product_info_for_filename(basename)
-            product_url = f"{BASE_URL.rstrip('/')}/products/{product_slug.lstrip('/')}" if product_slug else None
-
-            transformed_matches.append({
-                "url": f"{AWS_URL}/{key}",
-                "score": score,
-                "filename": os.path.basename(key),
-                "productName": product_title if product_title else None,
-                "productUrl": product_url,
-                "sizes": sizes if sizes else "",
-                "category": category if category else ""
-            })
-
-        return jsonify({"results": transformed_matches})
+        index, matches = search_tile_rows_by_text(description)
+        with metrics.span("text.records"):
+            results = clip_records.gather(index, matches)
+        return jsonify({"results": results})
+    except InferencePoolBusy:
+        return jsonify({"error": "Server busy, retry shortly"}), 503
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": "Internal server error"}), 500
 
+# -----------------------
+# 🔹 API: Search by many texts
+# -----------------------
+@app.route('/search/batch', methods=['POST'])
+def search_by_text_batch():
+    try:
+        data = request.get_json(silent=True)
+        descriptions = data.get('descriptions') if isinstance(data, dict) else None
+        if not isinstance(descriptions, list) or not all(isinstance(d, str) for d in descriptions):
+            return jsonify({"error": "descriptions must be a list of strings"}), 400
+        descriptions = [d.strip() for d in descriptions]
+        if not descriptions or not all(descriptions):
+            return jsonify({"error": "A non-empty list of non-empty descriptions is required"}), 400
+        if len(descriptions) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"At most {MAX_BATCH_QUERIES} descriptions per request"}), 400
+
+        index, all_matches = search_tile_rows_by_text_batch(descriptions)
+        with metrics.span("text.records"):
+            results = [
+                {"description": description, "results": clip_records.gather(index, matches)}
+                for description, matches in zip(descriptions, all_matches)
+            ]
+        return jsonify({"results": results})
+    except InferencePoolBusy:
+        return jsonify({"error": "Server busy, retry shortly"}), 503
+    except Exception:
+        traceback.print_exc()
+        return jsonify({"error": "Internal server error"}), 500
+
+# -----------------------
+# 🔹 API: Inference stats
+# -----------------------
+@app.route('/stats', methods=['GET'])
+def inference_stats():
+    return jsonify({
+        "batchers": {
+            "resnet": feature_batcher.stats(),
+            "clip_text": text_batcher.stats(),
+        },
+        "text_embedding_cache": text_embedding_cache.stats(),
+        "image_query_cache": image_query_cache.stats(),
+        "inference_pool": pool.stats() if (pool := get_inference_pool()) is not None else None,
+        "image_cache": cache.stats() if (cache := get_image_cache()) is not None else None,
+    })
+
+# -----------------------
+# 🔹 API: Prometheus metrics
+# -----------------------
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
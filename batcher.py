@@ -0,0 +1,94 @@
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+
+# -----------------------
+# 🔹 Dynamic micro-batching
+# -----------------------
+class MicroBatcher:
+    """
+    Collects concurrent single-item inference calls and runs them as one
+    batched call. A batch is dispatched once `max_batch_size` items are
+    queued or `max_wait_ms` has passed since its first item arrived.
+
+    `batch_fn(items)` must return one result per item, in order.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=16, max_wait_ms=5.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = Counter()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def submit(self, item):
+        """Queue one item; returns a Future resolved with its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name} batch function returned {len(results)} results for {len(batch)} items"
+                    )
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                # Every waiting request thread gets the error; none is left hanging
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            }
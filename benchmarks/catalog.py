@@ -0,0 +1,131 @@
+import os
+import random
+from io import BytesIO
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+# -----------------------
+# 🔹 Synthetic catalogs
+# -----------------------
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def random_catalog(n, dim=512, clusters=256, spread=0.35, seed=0, chunk=100_000):
+    """
+    (n, dim) L2-normalized float32 rows drawn around `clusters` random
+    centres, so neighbourhoods (and near-duplicates) look like a real catalog
+    rather than uniform noise. Generated in chunks to keep peak memory at
+    roughly one copy of the output.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        block = centres[rng.integers(0, clusters, stop - start)]
+        block += spread * rng.standard_normal(block.shape).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        out[start:stop] = block
+    return out
+
+
+def perturbed_queries(vectors, count, noise=0.05, seed=1):
+    """Normalized queries near randomly chosen rows (what a re-photographed tile looks like)."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(vectors), count)
+    queries = vectors[rows] + noise * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def catalog_names(n, prefix="tiles/"):
+    return [f"{prefix}SYN{i:07d}_a.jpg" for i in range(n)]
+
+
+def synthetic_mapping(names, coverage=0.8, seed=2):
+    """Product mapping (basename -> title/slug/sizes/category) covering `coverage` of `names`."""
+    rng = random.Random(seed)
+    mapping = {}
+    for name in names:
+        if rng.random() < coverage:
+            base = os.path.basename(name).lower()
+            mapping[base] = {
+                "title": f"Tile {base[:10]}",
+                "slug": f"tile-{base[:10]}",
+                "sizes": "300x600, 600x600",
+                "category": rng.choice(["Floor", "Wall", "Outdoor", "Mosaic"]),
+            }
+    return mapping
+
+
+# -----------------------
+# 🔹 Synthetic images
+# -----------------------
+def _augment(image, rng):
+    """One randomly augmented copy: crop, flip/rotate, colour jitter and a JPEG round trip."""
+    w, h = image.size
+    scale = rng.uniform(0.75, 1.0)
+    cw, ch = int(w * scale), int(h * scale)
+    left, top = rng.randint(0, w - cw), rng.randint(0, h - ch)
+    image = image.crop((left, top, left + cw, top + ch))
+    if rng.random() < 0.5:
+        image = ImageOps.mirror(image)
+    image = image.rotate(rng.choice([0, 90, 180, 270]), expand=True)
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.8, 1.2))
+    image = ImageEnhance.Color(image).enhance(rng.uniform(0.8, 1.2))
+    return image
+
+
+def _jpeg_bytes(image, max_side=512, quality=85):
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def tile_images(folder="static/tiles", copies=0, seed=3, max_side=512):
+    """
+    [(name, jpeg bytes)]: every image in `folder` plus `copies` augmented
+    variants of each, downscaled to `max_side` so the catalog stays small.
+    """
+    rng = random.Random(seed)
+    images = []
+    for fname in sorted(os.listdir(folder)):
+        if not fname.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        stem = os.path.splitext(fname)[0].replace(" ", "_")
+        original = Image.open(os.path.join(folder, fname)).convert("RGB")
+        images.append((f"{stem}.jpg", _jpeg_bytes(original, max_side)))
+        for copy in range(copies):
+            images.append((f"{stem}_aug{copy:03d}.jpg", _jpeg_bytes(_augment(original, rng), max_side)))
+    return images
+
+
+# -----------------------
+# 🔹 Local S3 stand-in (moto)
+# -----------------------
+@contextmanager
+def moto_bucket(bucket, prefix, images):
+    """
+    In-process S3 (moto) holding `images` under `prefix` in `bucket`. The
+    project's s3_store client is reset on entry and exit so it binds to the
+    mocked endpoint.
+    """
+    try:
+        from moto import mock_aws
+    except ImportError:  # moto < 5
+        from moto import mock_s3 as mock_aws
+    import boto3
+    from s3_store import reset_s3_client
+
+    with mock_aws():
+        client = boto3.client("s3", region_name=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+        client.create_bucket(Bucket=bucket)
+        for name, data in images:
+            client.put_object(Bucket=bucket, Key=f"{prefix}{name}", Body=data)
+        reset_s3_client()
+        try:
+            yield client
+        finally:
+            reset_s3_client()
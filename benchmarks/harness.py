@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import numpy as np
+
+# -----------------------
+# 🔹 Measurement and baselines
+# -----------------------
+# Each benchmark produces one result dict:
+#   {"name", "params", "p50_ms", "p99_ms", "mean_ms", "throughput", "unit", "peak_rss_mb"}
+# Throughput is items per second (queries, rows, images). peak_rss_mb is the
+# process high-water mark after the benchmark ran (ru_maxrss never goes
+# down, so run memory-sensitive suites in their own process to isolate them).
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def measure(name, fn, inputs, params=None, warmup=3, items_per_call=1, unit="queries"):
+    """Call `fn(x)` for each of `inputs` (after `warmup` untimed calls) and summarize the latencies."""
+    for x in inputs[:warmup]:
+        fn(x)
+    latencies = []
+    start = time.perf_counter()
+    for x in inputs:
+        t0 = time.perf_counter()
+        fn(x)
+        latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - start
+    return summarize(name, latencies, wall, len(inputs) * items_per_call, params, unit)
+
+
+def measure_once(name, fn, items, params=None, unit="items"):
+    """Time a single long call (e.g. an index build) processing `items` things."""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return summarize(name, [elapsed], elapsed, items, params, unit)
+
+
+def summarize(name, latencies, wall, items, params=None, unit="queries"):
+    ms = np.asarray(latencies) * 1000.0
+    result = {
+        "name": name,
+        "params": params or {},
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "throughput": round(items / wall, 2) if wall else 0.0,
+        "unit": unit,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(f"   • {result_key(result):55s} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+          f"{result['throughput']:10.1f} {unit}/s  rss {result['peak_rss_mb']:.0f} MB")
+    return result
+
+
+def result_key(result):
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]" if params else result["name"]
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+def load_results(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["results"]
+    except FileNotFoundError:
+        return None
+
+
+def compare(results, baseline, tolerance=0.15):
+    """
+    Regressions of `results` against `baseline` (matched by name + params):
+    latency (p50/p99) up or throughput down by more than `tolerance`.
+    Returns a list of human-readable findings.
+    """
+    previous = {result_key(r): r for r in baseline}
+    findings = []
+    for result in results:
+        key = result_key(result)
+        old = previous.get(key)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if old[metric] > 0 and result[metric] > old[metric] * (1 + tolerance):
+                findings.append(f"{key}: {metric} {old[metric]:.3f} → {result[metric]:.3f} "
+                                f"(+{(result[metric] / old[metric] - 1) * 100:.0f}%)")
+        if old["throughput"] > 0 and result["throughput"] < old["throughput"] * (1 - tolerance):
+            findings.append(f"{key}: throughput {old['throughput']:.1f} → {result['throughput']:.1f} "
+                            f"({(result['throughput'] / old['throughput'] - 1) * 100:.0f}%)")
+    return findings
@@ -0,0 +1,248 @@
+# benchmarks/run.py
+# Benchmark suite for search, deduplication, product enrichment and index
+# builds on synthetic catalogs, with S3 served in-process by moto.
+#   python -m benchmarks.run                                  -> numpy-only suites (search, dedup, enrichment)
+#   python -m benchmarks.run --suites build,image,text --copies 10
+#   python -m benchmarks.run --sizes 1000,10000,100000,1000000 --save-baseline
+#   python -m benchmarks.run --fail-on-regression             -> exit 1 if worse than the baseline
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+# The project reads its configuration from the environment at import time, so
+# point every path and the bucket at a scratch area before importing it.
+WORKDIR = tempfile.mkdtemp(prefix="tile-bench-")
+BENCH_ENV = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_BUCKET": "tile-bench",
+    "S3_FOLDER": "tiles/",
+    "PRODUCTS_EXCEL_KEY": "products/products.xlsx",
+    "INDEX_DIR": os.path.join(WORKDIR, "tile_index"),
+    "INDEX_FILE": os.path.join(WORKDIR, "tile_index.pkl"),
+    "CLIP_INDEX_DIR": os.path.join(WORKDIR, "tile_clip_index"),
+    "CLIP_INDEX_FILE": os.path.join(WORKDIR, "tile_clip_index.pkl"),
+    "PRODUCT_MAP_CACHE_FILE": "",
+    "TEXT_EMBEDDING_CACHE_DIR": "",
+    # Fresh per run: build_image_index downloads, build_catalog_indexes then reads the cache
+    "IMAGE_CACHE_DIR": os.path.join(WORKDIR, "image_cache"),
+    "IMAGE_QUERY_CACHE_SIZE": "0",  # measure the work, not the result cache
+    "TEXT_EMBEDDING_CACHE_SIZE": "0",
+    "INFERENCE_BATCHING": "0",
+}
+for _name, _value in BENCH_ENV.items():
+    os.environ[_name] = _value
+
+import numpy as np  # noqa: E402
+from benchmarks.catalog import (  # noqa: E402
+    catalog_names,
+    moto_bucket,
+    perturbed_queries,
+    random_catalog,
+    synthetic_mapping,
+    tile_images,
+)
+from benchmarks.harness import compare, load_results, measure, measure_once, save_results  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+TEXT_QUERIES = [
+    "white marble floor tile", "blue mosaic pool tiles", "grey matt porcelain", "wood effect plank",
+    "black and white patterned tile", "terracotta hexagon", "glossy green subway tile", "bathroom wall tiles",
+]
+
+
+# -----------------------
+# 🔹 Numpy-only suites (random vectors, 1k..1M rows)
+# -----------------------
+def bench_search(sizes, queries, top_k=20):
+    from vector_index import IndexSnapshot, greedy_dedup
+
+    results = []
+    pool = max(4 * top_k, 128)
+    for n in sizes:
+        vectors = random_catalog(n)
+        snapshot = IndexSnapshot(catalog_names(n), vectors)
+        qs = list(perturbed_queries(vectors, queries))
+
+        results.append(measure("vector_search", lambda q: snapshot.search(q, pool), qs, {"rows": n, "k": pool}))
+
+        def search_and_dedup(q):
+            ids, _ = snapshot.search(q, pool, min_score=0.0)
+            return greedy_dedup(snapshot.vectors, ids, top_k, 0.01)
+        results.append(measure("search+dedup", search_and_dedup, qs, {"rows": n, "top_k": top_k}))
+
+        batch = np.vstack(qs[:64])
+        results.append(measure(
+            "vector_search_batch", lambda b: snapshot.search_batch(b, pool), [batch] * 10,
+            {"rows": n, "batch": len(batch)}, items_per_call=len(batch),
+        ))
+        del vectors, snapshot
+    return results
+
+
+def bench_dedup(queries, pools=(128, 512, 2048), top_k=20):
+    from vector_index import greedy_dedup
+
+    # Few, tight clusters so ranked pools are full of near-duplicates
+    vectors = random_catalog(50_000, clusters=64, spread=0.05)
+    rng = np.random.default_rng(4)
+    results = []
+    for pool in pools:
+        ranked = [rng.choice(len(vectors), pool, replace=False) for _ in range(queries)]
+        results.append(measure(
+            "greedy_dedup", lambda rows: greedy_dedup(vectors, rows, top_k, 0.01), ranked,
+            {"pool": pool, "top_k": top_k},
+        ))
+    return results
+
+
+def bench_enrichment(sizes, queries, top_k=20):
+    from records import build_records
+
+    results = []
+    for n in sizes:
+        names = catalog_names(n)
+        mapping = synthetic_mapping(names)
+        results.append(measure_once(
+            "build_records", lambda: build_records(names, mapping), n, {"rows": n}, unit="rows",
+        ))
+        table = build_records(names, mapping)
+        rng = np.random.default_rng(5)
+        matches = [list(zip(rng.integers(0, n, top_k).tolist(), rng.random(top_k).tolist())) for _ in range(queries)]
+        results.append(measure(
+            "records_gather", lambda m: [dict(table[row], score=float(score)) for row, score in m], matches,
+            {"rows": n, "top_k": top_k},
+        ))
+    return results
+
+
+# -----------------------
+# 🔹 Model suites (torch / open_clip, moto S3)
+# -----------------------
+def _products_excel(names):
+    """Products sheet for `names` in the layout product_mapping.parse_product_mapping expects."""
+    from io import BytesIO
+    import pandas as pd
+
+    mapping = synthetic_mapping(names)
+    frame = pd.DataFrame([
+        {"Images": f"tiles/{name}", "Product Title": info["title"], "Slug Name": info["slug"],
+         "Sizes": info["sizes"], "Category": info["category"]}
+        for name, info in mapping.items()
+    ])
+    buffer = BytesIO()
+    frame.to_excel(buffer, sheet_name="Worksheet", index=False)
+    return buffer.getvalue()
+
+
+def bench_images(suites, copies, queries):
+    from config import AWS_BUCKET, PRODUCTS_EXCEL_KEY, S3_FOLDER
+    from image_matcher import find_best_matches, update_image_index
+
+    images = tile_images(copies=copies)
+    results = []
+    with moto_bucket(AWS_BUCKET, S3_FOLDER, images) as client:
+        client.put_object(Bucket=AWS_BUCKET, Key=PRODUCTS_EXCEL_KEY, Body=_products_excel([n for n, _ in images]))
+
+        results.append(measure_once(
+            "build_image_index", lambda: update_image_index(rebuild=True, with_clip=False), len(images),
+            {"images": len(images)}, unit="images",
+        ))
+        results.append(measure_once(
+            "update_image_index_noop", lambda: update_image_index(with_clip=False), len(images),
+            {"images": len(images)}, unit="images",
+        ))
+        # One download/decode feeding the hash, ResNet and CLIP indexes
+        results.append(measure_once(
+            "build_catalog_indexes", lambda: update_image_index(rebuild=True, with_clip=True), len(images),
+            {"images": len(images)}, unit="images",
+        ))
+
+        if "image" in suites:
+            # Fresh augmentations (different seed) so queries are near, not identical to, catalog images
+            query_images = [data for _, data in tile_images(copies=1, seed=99)]
+            query_images = (query_images * (queries // max(len(query_images), 1) + 1))[:queries]
+            results.append(measure(
+                "find_best_matches", find_best_matches, query_images, {"catalog": len(images)},
+            ))
+    return results
+
+
+def bench_text(queries, copies):
+    from clip_matcher import build_clip_index, search_tiles_by_text
+
+    folder = os.path.join(WORKDIR, "clip_tiles")
+    os.makedirs(folder, exist_ok=True)
+    images = tile_images(copies=copies)
+    for name, data in images:
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(data)
+
+    results = [measure_once(
+        "build_clip_index", lambda: build_clip_index(folder), len(images), {"images": len(images)}, unit="images",
+    )]
+    texts = (TEXT_QUERIES * (queries // len(TEXT_QUERIES) + 1))[:queries]
+    results.append(measure("search_tiles_by_text", search_tiles_by_text, texts, {"catalog": len(images)}))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark search, dedup, enrichment and index builds")
+    parser.add_argument("--suites", default="search,dedup,enrichment",
+                        help="comma-separated: search, dedup, enrichment, build, image, text")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="random-catalog row counts")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--copies", type=int, default=5, help="augmented copies per static/tiles image")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    suites = {s.strip() for s in args.suites.split(",") if s.strip()}
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    try:
+        if "search" in suites:
+            print("🏁 search")
+            results += bench_search(sizes, args.queries)
+        if "dedup" in suites:
+            print("🏁 dedup")
+            results += bench_dedup(args.queries)
+        if "enrichment" in suites:
+            print("🏁 enrichment")
+            results += bench_enrichment(sizes, args.queries)
+        if suites & {"build", "image"}:
+            print("🏁 build / image")
+            results += bench_images(suites, args.copies, args.queries)
+        if "text" in suites:
+            print("🏁 text")
+            results += bench_text(args.queries, args.copies)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    save_results(args.output, results)
+    print(f"💾 Results written to {args.output}")
+
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print(f"💾 Baseline updated: {args.baseline}")
+        sys.exit(0)
+
+    baseline = load_results(args.baseline)
+    if baseline is None:
+        print(f"ℹ️ No baseline at {args.baseline}; run with --save-baseline to create one")
+        sys.exit(0)
+    findings = compare(results, baseline, args.tolerance)
+    if findings:
+        print(f"⚠️ {len(findings)} regression(s) beyond {args.tolerance:.0%}:")
+        for finding in findings:
+            print(f"   • {finding}")
+        sys.exit(1 if args.fail_on_regression else 0)
+    print(f"✅ No regressions beyond {args.tolerance:.0%}")
@@ -0,0 +1,165 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from fileio import atomic_write
+
+
+# -----------------------
+# 🔹 In-process LRU
+# -----------------------
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with hit/miss counters."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+# -----------------------
+# 🔹 Two-tier embedding cache
+# -----------------------
+def normalize_query_text(text):
+    """Case- and whitespace-insensitive cache key (the CLIP tokenizer lowercases anyway)."""
+    return " ".join(str(text).lower().split())
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by normalized text.
+    Tier 1 is an in-process LRU; tier 2 (optional) is a directory of .npy files
+    that survives restarts. Entries are partitioned by `namespace` (model name +
+    pretrained tag), so changing the model never serves stale vectors.
+    """
+
+    def __init__(self, namespace, max_size=1024, cache_dir=None):
+        self.namespace = namespace
+        self.memory = LRUCache(max_size)
+        self.cache_dir = None
+        if cache_dir:
+            ns_hash = hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16]
+            self.cache_dir = os.path.join(cache_dir, ns_hash)
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npy")
+
+    def get(self, text):
+        key = normalize_query_text(text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                vector = np.load(path)
+                self.disk_hits += 1
+                self.memory.put(key, vector)
+                return vector
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable embedding cache entry {path}: {e}")
+
+        self.misses += 1
+        return None
+
+    def put(self, text, vector):
+        key = normalize_query_text(text)
+        vector = np.asarray(vector)
+        self.memory.put(key, vector)
+
+        if self.cache_dir:
+            try:
+                with atomic_write(self._disk_path(key)) as f:
+                    np.save(f, vector)
+            except Exception as e:
+                print(f"⚠️ Could not persist embedding cache entry: {e}")
+
+    def stats(self):
+        return {
+            "namespace": self.namespace,
+            "memory_size": len(self.memory),
+            "memory_max_size": self.memory.max_size,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_enabled": bool(self.cache_dir),
+        }
+
+
+# -----------------------
+# 🔹 Image query cache
+# -----------------------
+def content_digest(data):
+    """Hash of raw upload bytes (None for paths, file objects and PIL images)."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return None
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class QueryResultCache:
+    """
+    Per-upload caches keyed by content digest: the ranked results for a given
+    (top_k, thresholds) and the query embedding itself, so a request that only
+    changes thresholds skips decode and the forward pass. Every key includes
+    the index version, so requests on an old and a new snapshot during a
+    reload never see (or evict) each other's entries; entries for retired
+    versions simply age out of the LRU.
+    """
+
+    def __init__(self, max_size=1024):
+        self.results = LRUCache(max_size)
+        self.queries = LRUCache(max_size)
+
+    def get_result(self, version, digest, params):
+        results = self.results.get((version, digest, params))
+        return list(results) if results is not None else None
+
+    def put_result(self, version, digest, params, results):
+        self.results.put((version, digest, params), list(results))
+
+    def get_query(self, version, digest):
+        """-> (normalized query vector, exact-match row or None), or None."""
+        return self.queries.get((version, digest))
+
+    def put_query(self, version, digest, query, exact_row):
+        self.queries.put((version, digest), (query, exact_row))
+
+    def stats(self):
+        return {"results": self.results.stats(), "queries": self.queries.stats()}
@@ -1,81 +1,221 @@
 import os
-import torch
-import open_clip
-from sklearn.neighbors import NearestNeighbors
+import threading
 import numpy as np
-import joblib
 from PIL import Image
+from batcher import MicroBatcher
+from cache import EmbeddingCache
+from config import (
+    CLIP_BACKEND,
+    CLIP_INDEX_DIR,
+    CLIP_INDEX_FILE,
+    CLIP_MODEL_NAME,
+    CLIP_MODEL_TAG,
+    CLIP_PRETRAINED,
+    INDEX_KEEP_VERSIONS,
+    INFERENCE_BATCHING,
+    INFERENCE_BATCH_WAIT_MS,
+    INFERENCE_MAX_BATCH,
+    INGEST_BATCH_SIZE,
+    INGEST_WORKERS,
+    TEXT_EMBEDDING_CACHE_SIZE,
+    TEXT_EMBEDDING_CACHE_DIR,
+)
+from inference import load_encoder, method_module
+from ingest import StageTimer, batched, iter_prefetched
+from metrics import span, watch_index
+from records import ResponseRecords, write_records
+from index_store import build_lock, new_version_dir, new_version_name, publish_version, write_index
+from utils import open_image
+from vector_index import VectorIndex, normalize_rows, prepare_search_artifacts
+from worker_pool import get_inference_pool
+
+
+# Loaded on first use under _model_lock (see inference.py)
+_model_lock = threading.RLock()
 
 
 def get_clip_model():
     if not hasattr(get_clip_model, "model"):
-        model, _, preprocess = open_clip.create_model_and_transforms(
-            'ViT-B-32', pretrained='laion2b_s34b_b79k'
-        )
-        tokenizer = open_clip.get_tokenizer('ViT-B-32')
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = model.to(device)
-        model.eval()
-        get_clip_model.model = model
-        get_clip_model.preprocess = preprocess
-        get_clip_model.tokenizer = tokenizer
-        get_clip_model.device = device
+        with _model_lock:
+            if not hasattr(get_clip_model, "model"):
+                import torch
+                import open_clip
+                model, _, preprocess = open_clip.create_model_and_transforms(
+                    CLIP_MODEL_NAME, pretrained=CLIP_PRETRAINED
+                )
+                tokenizer = open_clip.get_tokenizer(CLIP_MODEL_NAME)
+                # Exported/quantized backends run on the CPU, so only eager uses a GPU
+                device = "cuda" if torch.cuda.is_available() and CLIP_BACKEND == "eager" else "cpu"
+                model = model.to(device)
+                model.eval()
+                get_clip_model.preprocess = preprocess
+                get_clip_model.tokenizer = tokenizer
+                get_clip_model.device = device
+                # Set last: the unlocked hasattr check above must not see a half-initialized model
+                get_clip_model.model = model
     return get_clip_model.model, get_clip_model.preprocess, get_clip_model.tokenizer, get_clip_model.device
 
 
+def clip_image_size(model):
+    size = getattr(model.visual, "image_size", 224)
+    return tuple(size) if isinstance(size, (tuple, list)) else (size, size)
+
+
+def get_clip_encoders():
+    """(text, image) CLIP encoders on the configured CLIP_BACKEND (see inference.py)."""
+    if not hasattr(get_clip_encoders, "runners"):
+        with _model_lock:
+            if not hasattr(get_clip_encoders, "runners"):
+                import torch
+                model, _, tokenizer, device = get_clip_model()
+                text = load_encoder(
+                    "clip-text", CLIP_MODEL_TAG, lambda: method_module(model, "encode_text"),
+                    tokenizer(["a photo of a tile"]), CLIP_BACKEND, device=device,
+                )
+                image = load_encoder(
+                    "clip-image", CLIP_MODEL_TAG, lambda: method_module(model, "encode_image"),
+                    torch.zeros(1, 3, *clip_image_size(model)), CLIP_BACKEND, device=device,
+                )
+                get_clip_encoders.runners = (text, image)
+    return get_clip_encoders.runners
+
+
+# Cached text embeddings are partitioned by model, so a model change invalidates them
+text_embedding_cache = EmbeddingCache(
+    CLIP_MODEL_TAG,
+    max_size=TEXT_EMBEDDING_CACHE_SIZE,
+    cache_dir=TEXT_EMBEDDING_CACHE_DIR or None,
+)
+
+
+def encode_texts_batch(texts):
+    """One CLIP text forward pass over a list of strings -> (n, dim) array."""
+    _, _, tokenizer, _ = get_clip_model()
+    text_encoder, _ = get_clip_encoders()
+    return text_encoder(tokenizer(list(texts)))
+
+
+def _encode_texts(texts):
+    """encode_texts_batch, run in the inference pool when one is configured."""
+    pool = get_inference_pool()
+    if pool is not None:
+        with span("text.pool_embed"):
+            return pool.embed_texts(texts)
+    return encode_texts_batch(texts)
+
+
+# Concurrent /search requests share one text forward pass
+text_batcher = MicroBatcher(
+    "clip-text", _encode_texts,
+    max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+)
+
+
 def encode_text(text):
-    model, _, tokenizer, device = get_clip_model()
-    tokens = tokenizer([text]).to(device)
-    with torch.no_grad():
-        text_features = model.encode_text(tokens)
-    return text_features.cpu().numpy()
+    cached = text_embedding_cache.get(text)
+    if cached is not None:
+        return cached.copy()
+
+    if INFERENCE_BATCHING:
+        text_features = text_batcher(text).reshape(1, -1)
+    else:
+        text_features = _encode_texts([text])
+    text_embedding_cache.put(text, text_features)
+    return text_features.copy()
 
 
-def encode_image(image_path):
-    model, preprocess, _, device = get_clip_model()
-    image = Image.open(image_path).convert("RGB")
-    image_input = preprocess(image).unsqueeze(0).to(device)
-    with torch.no_grad():
-        image_features = model.encode_image(image_input)
-    return image_features.cpu().numpy()
+def encode_images_batch(tensors):
+    """One CLIP image forward pass over a list of preprocessed tensors -> (n, dim) array."""
+    import torch
+    _, image_encoder = get_clip_encoders()
+    return image_encoder(torch.stack(list(tensors)))
 
 
-def build_clip_index(tile_folder="static/tiles", output_file="tile_clip_index.pkl"):
+def encode_image(image_input):
+    """`image_input` may be a path, raw bytes, a file-like object or a PIL image."""
+    _, preprocess, _, _ = get_clip_model()
+    image = open_image(image_input, "RGB")
+    return encode_images_batch([preprocess(image)])
+
+
+def build_clip_index(tile_folder="static/tiles", output_dir=CLIP_INDEX_DIR):
+    """
+    Index a local folder of tiles (keyed by filename). The catalog CLIP index
+    is normally written by image_matcher.update_image_index, from the same S3
+    download and decode as the ResNet index.
+    """
     tile_names = []
     feature_list = []
+    _, preprocess, _, _ = get_clip_model()
+    fnames = [f for f in os.listdir(tile_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    timer = StageTimer("clip_index")
 
-    for fname in os.listdir(tile_folder):
-        if fname.lower().endswith(('.png', '.jpg', '.jpeg')):
-            path = os.path.join(tile_folder, fname)
-            try:
-                features = encode_image(path)
-                tile_names.append(fname)
-                feature_list.append(features[0])
-            except Exception as e:
-                print(f"⚠️ Failed to process {fname}: {e}")
+    def load(fname):
+        with timer.time("decode+preprocess"):
+            return preprocess(Image.open(os.path.join(tile_folder, fname)).convert("RGB"))
 
-    feature_matrix = np.vstack(feature_list)
-    joblib.dump((tile_names, feature_matrix), output_file)
-    print(f"✅ Saved CLIP feature index to {output_file} with {len(tile_names)} tiles.")
+    def loaded_tiles():
+        for fname, tensor, error in iter_prefetched(load, fnames, INGEST_WORKERS):
+            if error is not None:
+                print(f"⚠️ Failed to process {fname}: {error}")
+                continue
+            yield fname, tensor
 
+    for batch in batched(loaded_tiles(), INGEST_BATCH_SIZE):
+        batch_names, tensors = zip(*batch)
+        try:
+            with timer.time("embed", len(tensors)):
+                features = encode_images_batch(tensors)
+        except Exception as e:
+            print(f"⚠️ Failed to embed batch starting at {batch_names[0]}: {e}")
+            continue
+        tile_names.extend(batch_names)
+        feature_list.extend(features)
+
+    with timer.time("write", len(tile_names)):
+        feature_matrix = normalize_rows(np.vstack(feature_list))
+        with build_lock(output_dir):
+            version = new_version_name()
+            version_dir = new_version_dir(output_dir, version)
+            header = write_index(version_dir, tile_names, feature_matrix, CLIP_MODEL_TAG)
+            write_records(version_dir, header["id"], tile_names)
+            prepare_search_artifacts(version_dir, header["id"], feature_matrix)
+            publish_version(output_dir, version, keep=INDEX_KEEP_VERSIONS)
+    timer.report("CLIP index build", len(fnames))
+    print(f"✅ Saved CLIP feature index to {output_dir} with {len(tile_names)} tiles.")
+
+
+_clip_index = VectorIndex(CLIP_INDEX_DIR, legacy_path=CLIP_INDEX_FILE, model=CLIP_MODEL_TAG)
+watch_index("clip", _clip_index)
+
+clip_records = ResponseRecords(CLIP_INDEX_DIR)
 
-def search_tiles_by_text(query, top_k=20, min_threshold=0.1, dedup_threshold=0.01):
-    if not os.path.exists("tile_clip_index.pkl"):
-        print("❌ You must run reindex_clip.py first.")
-        return []
 
-    tile_names, feature_matrix = joblib.load("tile_clip_index.pkl")
-    text_vector = encode_text(query)
+def get_clip_index():
+    """Current CLIP index snapshot, or None if no index has been built."""
+    return _clip_index.get()
 
-    nn_model = NearestNeighbors(n_neighbors=min(top_k + 10, len(tile_names)), metric="cosine")
-    nn_model.fit(feature_matrix)
 
-    distances, indices = nn_model.kneighbors(text_vector)
+def encode_texts(texts):
+    """
+    Embeddings for many texts -> (n, dim) array. Cached texts are served from
+    the embedding cache; the rest share one text forward pass.
+    """
+    vectors = [text_embedding_cache.get(text) for text in texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = _encode_texts([texts[i] for i in missing])
+        for i, features in zip(missing, encoded):
+            vectors[i] = features.reshape(1, -1)
+            text_embedding_cache.put(texts[i], vectors[i])
+    return np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+
+def _filter_text_hits(indices, similarities, top_k, min_threshold, dedup_threshold):
     results = []
 
-    for dist, idx in zip(distances[0], indices[0]):
-        sim = 1 - dist
-        tile_name = tile_names[idx]
+    for idx, sim in zip(indices, similarities):
+        sim = float(sim)
 
         if sim < min_threshold:
             continue
@@ -84,10 +224,56 @@ def search_tiles_by_text(query, top_k=20, min_threshold=0.1, dedup_threshold=0.0
         if is_duplicate:
             continue
 
-        results.append((tile_name, sim))
+        results.append((int(idx), sim))
 
         if len(results) >= top_k:
             break
 
     return sorted(results, key=lambda x: x[1], reverse=True)
 
+
+def search_tiles_by_text(query, top_k=20, min_threshold=0.1, dedup_threshold=0.01):
+    """[(tile_name, score)] best first; see `search_tile_rows_by_text`."""
+    index, matches = search_tile_rows_by_text(query, top_k, min_threshold, dedup_threshold)
+    return [(index.names[row], score) for row, score in matches]
+
+
+def search_tile_rows_by_text(query, top_k=20, min_threshold=0.1, dedup_threshold=0.01):
+    """(index snapshot, [(row, score)] best first); rows index the snapshot, e.g. for `clip_records.gather`."""
+    index = get_clip_index()
+    if index is None:
+        print("❌ You must run reindex_clip.py first.")
+        return index, []
+
+    with span("text.encode"):
+        text_vector = normalize_rows(encode_text(query))[0]
+    with span("text.search"):
+        indices, similarities = index.search(text_vector, top_k + 10)
+    with span("text.filter"):
+        return index, _filter_text_hits(indices, similarities, top_k, min_threshold, dedup_threshold)
+
+
+def search_tiles_by_text_batch(queries, top_k=20, min_threshold=0.1, dedup_threshold=0.01):
+    """[[(tile_name, score)], ...] per description; see `search_tile_rows_by_text_batch`."""
+    index, all_matches = search_tile_rows_by_text_batch(queries, top_k, min_threshold, dedup_threshold)
+    return [[(index.names[row], score) for row, score in matches] for matches in all_matches]
+
+
+def search_tile_rows_by_text_batch(queries, top_k=20, min_threshold=0.1, dedup_threshold=0.01):
+    """`search_tile_rows_by_text` for many descriptions with one forward pass and one matrix-matrix search."""
+    index = get_clip_index()
+    if index is None:
+        print("❌ You must run reindex_clip.py first.")
+        return index, [[] for _ in queries]
+    if not queries:
+        return index, []
+
+    with span("text.encode_batch"):
+        text_vectors = normalize_rows(encode_texts(list(queries)))
+    with span("text.search_batch"):
+        hits = index.search_batch(text_vectors, top_k + 10)
+    with span("text.filter"):
+        return index, [
+            _filter_text_hits(indices, similarities, top_k, min_threshold, dedup_threshold)
+            for indices, similarities in hits
+        ]
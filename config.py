@@ -1,5 +1,4 @@
 import os
-import torch
 
 # ==========================
 # 🔒 AWS Configuration (env-based for production)
@@ -9,21 +8,126 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")  # must be set in env
 AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION")
 AWS_BUCKET = os.getenv("AWS_BUCKET")
 
+# Client connection pool / retries and concurrent download workers
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", 5))
+S3_RETRY_BACKOFF = float(os.getenv("S3_RETRY_BACKOFF", 0.5))  # seconds, doubled per attempt
+S3_DOWNLOAD_WORKERS = int(os.getenv("S3_DOWNLOAD_WORKERS", 16))
+
+# Local cache of catalog images keyed by S3 key + ETag, so reindexing skips the
+# network ("" disables). Least recently used entries go once it exceeds the cap.
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+# > 0: store images downscaled to this shorter side (PNG) instead of the originals;
+# each records the original's digest, so the same-bytes upload fast path still works
+IMAGE_CACHE_DERIVATIVE_SIZE = int(os.getenv("IMAGE_CACHE_DERIVATIVE_SIZE", 0))
+
 # Pre-signed URL / static S3 path
 AWS_URL = f"https://{AWS_BUCKET}.s3.{AWS_DEFAULT_REGION}.amazonaws.com"
 
 # ==========================
 # 📂 Index & Storage
 # ==========================
-INDEX_FILE = os.getenv("INDEX_FILE", "tile_index.pkl")  # local file (rebuild via reindex.py)
+# Memory-mapped index directories (rebuild via reindex.py / reindex_clip.py)
+INDEX_DIR = os.getenv("INDEX_DIR", "tile_index")
+CLIP_INDEX_DIR = os.getenv("CLIP_INDEX_DIR", "tile_clip_index")
+# Legacy joblib pickles: read until the directories exist, converted by convert_index.py
+INDEX_FILE = os.getenv("INDEX_FILE", "tile_index.pkl")
+CLIP_INDEX_FILE = os.getenv("CLIP_INDEX_FILE", "tile_clip_index.pkl")
+# Builds write a new version under INDEX_DIR/versions and swap INDEX_DIR/CURRENT;
+# this many previous versions are kept for rollback (reindex.py --rollback)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", 3))
+# The web watcher (and a cold start with no index) runs index builds in a separate process at this nice level,
+# with torch limited to INDEX_BUILD_THREADS threads (0 = library default)
+INDEX_BUILD_IN_SUBPROCESS = os.getenv("INDEX_BUILD_IN_SUBPROCESS", "1").lower() in ("1", "true", "yes")
+INDEX_BUILD_NICE = int(os.getenv("INDEX_BUILD_NICE", 10))
+INDEX_BUILD_THREADS = int(os.getenv("INDEX_BUILD_THREADS", 2))
+
+# Optional compressed first-pass search: none | float16 | int8 | pq.
+# The best top_k * RERANK_FACTOR candidates are re-scored at full precision.
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none").lower()
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", 4))
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", 64))  # must divide the embedding dim (512)
+
+# Search backend for both indexes: numpy (brute force, optionally compressed) | faiss
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "numpy").lower()
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "hnsw").lower()  # flat | ivf | hnsw
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", 1024))  # IVF lists (capped by catalog size)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", 16))  # IVF lists visited per query
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", 200))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 128))
+
+# Index builds: download/decode worker threads and images per forward pass
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 8))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 32))
+# The S3 ingest also writes the CLIP index from the same download/decode, in the same key order
+INGEST_CLIP_INDEX = os.getenv("INGEST_CLIP_INDEX", "1").lower() in ("1", "true", "yes")
+
+# Query-time micro-batching of concurrent forward passes (ResNet uploads, CLIP text)
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "1").lower() in ("1", "true", "yes")
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 16))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", 5))
+
+# CPU inference backend per encoder: eager | int8 | torchscript | onnx | onnx-int8
+# (non-eager backends use exported models from MODEL_EXPORT_DIR, see export_models.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager").lower()
+RESNET_BACKEND = os.getenv("RESNET_BACKEND", INFERENCE_BACKEND).lower()
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", INFERENCE_BACKEND).lower()
+MODEL_EXPORT_DIR = os.getenv("MODEL_EXPORT_DIR", "exported_models")
+INFERENCE_CHANNELS_LAST = os.getenv("INFERENCE_CHANNELS_LAST", "0").lower() in ("1", "true", "yes")
+# Intra-op / inter-op thread pools for torch and ONNX Runtime (0 = library default)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0))
+INFERENCE_INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", 0))
+
+# Optional process pool for decode + preprocessing + forward passes (0 = run in request threads).
+# Each worker loads both models once and pins torch to INFERENCE_POOL_THREADS threads.
+INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", 0))
+INFERENCE_POOL_THREADS = int(os.getenv("INFERENCE_POOL_THREADS", 1))
+INFERENCE_POOL_MAX_PENDING = int(os.getenv("INFERENCE_POOL_MAX_PENDING", 64))  # beyond this: 503
+INFERENCE_POOL_TIMEOUT = float(os.getenv("INFERENCE_POOL_TIMEOUT", 30))  # seconds per task
+INFERENCE_POOL_HEALTH_INTERVAL = float(os.getenv("INFERENCE_POOL_HEALTH_INTERVAL", 30))  # 0 disables
+
+# Images whose 64-bit perceptual hashes differ in at most this many bits are
+# duplicate candidates at ingest (0 = exact hash matches only); one is only
+# collapsed into the kept image if their ResNet vectors are at least this similar
+HASH_DEDUP_RADIUS = int(os.getenv("HASH_DEDUP_RADIUS", 2))
+HASH_DEDUP_COSINE = float(os.getenv("HASH_DEDUP_COSINE", 0.98))
+# A query whose perceptual hash matches a catalog image is only pinned as an
+# exact match if its bytes are identical or its vector is at least this similar
+EXACT_MATCH_COSINE = float(os.getenv("EXACT_MATCH_COSINE", 0.99999))
+
+# Device (CPU/GPU): resolved on first access so importing config doesn't pull in torch
+def __getattr__(name):
+    if name == "DEVICE":
+        import torch
+        globals()["DEVICE"] = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        return globals()["DEVICE"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Device (CPU/GPU)
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# CLIP text/image encoder
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "ViT-B-32")
+CLIP_PRETRAINED = os.getenv("CLIP_PRETRAINED", "laion2b_s34b_b79k")
 
-# Uploads (user query images)
+# Model tags recorded in index headers (and used to partition embedding caches)
+RESNET_MODEL_TAG = "torchvision/resnet18/IMAGENET1K_V1"
+CLIP_MODEL_TAG = f"open_clip/{CLIP_MODEL_NAME}/{CLIP_PRETRAINED}"
+
+# Uploaded-image result/embedding cache, keyed by content hash (0 disables)
+IMAGE_QUERY_CACHE_SIZE = int(os.getenv("IMAGE_QUERY_CACHE_SIZE", 1024))
+
+# Text embedding cache (in-process LRU + optional on-disk tier; empty dir disables disk)
+TEXT_EMBEDDING_CACHE_SIZE = int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", 4096))
+TEXT_EMBEDDING_CACHE_DIR = os.getenv("TEXT_EMBEDDING_CACHE_DIR", "")
+
+# Uploads (user query images) are decoded in memory; set SAVE_UPLOADS=1 to also
+# keep a copy in UPLOAD_FOLDER for debugging
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
+SAVE_UPLOADS = os.getenv("SAVE_UPLOADS", "0").lower() in ("1", "true", "yes")
 MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 5 * 1024 * 1024))  # 5 MB
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+# Batch endpoints (/upload/batch, /search/batch); MAX_CONTENT_LENGTH applies to the whole request
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", 100))
 
 # Matching threshold
 MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", 0.9))  # 90% similarity
@@ -37,12 +141,31 @@ PRODUCTS_EXCEL_KEY = os.getenv(
     "kclweb/all_products_16sept25-kajaria.xlsx"
 )
 PRODUCTS_EXCEL_SHEET = os.getenv("PRODUCTS_EXCEL_SHEET", "Worksheet")
+PRODUCT_MAP_TTL = float(os.getenv("PRODUCT_MAP_TTL", 300))  # seconds before a background refresh
+PRODUCT_MAP_CACHE_FILE = os.getenv("PRODUCT_MAP_CACHE_FILE", "product_map_cache.json")  # empty disables
 
 # ==========================
 # 🌐 Website Links
 # ==========================
 BASE_URL = os.getenv("BASE_URL", "https://demowebsite.kajariaceramics.com/")
 
+# ==========================
+# 🚀 Startup
+# ==========================
+# Load models/indexes and run dummy inference before reporting ready on /ready
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1").lower() in ("1", "true", "yes")
+# Failed warm-up phases are retried with exponential backoff between these bounds (seconds)
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", 5))
+WARMUP_RETRY_MAX_DELAY = float(os.getenv("WARMUP_RETRY_MAX_DELAY", 300))
+
+# ==========================
+# 📈 Observability
+# ==========================
+# Requests slower than this get their sampled stacks written to PROFILE_DIR (0 disables sampling)
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", 0))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
 # Flask secret key (for sessions / security)
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")  # replace in prod
 
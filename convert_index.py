@@ -0,0 +1,29 @@
+# convert_index.py
+# Convert legacy joblib index pickles into memory-mapped index directories.
+#   python convert_index.py                      -> both default indexes
+#   python convert_index.py SRC.pkl DEST_DIR --model TAG
+import argparse
+from config import INDEX_FILE, INDEX_DIR, CLIP_INDEX_FILE, CLIP_INDEX_DIR, RESNET_MODEL_TAG, CLIP_MODEL_TAG
+from index_store import convert_legacy_index
+from vector_index import prepare_live_index
+
+DEFAULT_CONVERSIONS = [
+    (INDEX_FILE, INDEX_DIR, RESNET_MODEL_TAG),
+    (CLIP_INDEX_FILE, CLIP_INDEX_DIR, CLIP_MODEL_TAG),
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert legacy .pkl indexes to index directories")
+    parser.add_argument("source", nargs="?", help="legacy .pkl index")
+    parser.add_argument("dest", nargs="?", help="output index directory")
+    parser.add_argument("--model", default=None, help="model tag to record in the header")
+    args = parser.parse_args()
+
+    conversions = [(args.source, args.dest, args.model)] if args.source and args.dest else DEFAULT_CONVERSIONS
+    for source, dest, model in conversions:
+        try:
+            count = convert_legacy_index(source, dest, model)
+            prepare_live_index(dest)
+            print(f"✅ Converted {source} → {dest} ({count} rows)")
+        except FileNotFoundError:
+            print(f"⚠️ {source} not found, skipping")
@@ -0,0 +1,42 @@
+# export_models.py
+# Export the ResNet18 and CLIP encoders for the non-eager inference backends.
+#   python export_models.py                                  -> every encoder, torchscript + onnx + onnx-int8
+#   python export_models.py --backends onnx --encoders clip-text
+import argparse
+from config import CLIP_MODEL_TAG, MODEL_EXPORT_DIR, RESNET_MODEL_TAG
+from inference import export_encoder, method_module
+
+ENCODERS = ("resnet18", "clip-text", "clip-image")
+
+
+def encoder_specs():
+    """name -> (model tag, eager module factory, example input batch)."""
+    import torch
+    from image_matcher import get_resnet_model
+    from clip_matcher import clip_image_size, get_clip_model
+
+    model, _, tokenizer, _ = get_clip_model()
+    return {
+        "resnet18": (RESNET_MODEL_TAG, get_resnet_model, torch.zeros(1, 3, 224, 224)),
+        "clip-text": (CLIP_MODEL_TAG, lambda: method_module(model, "encode_text"), tokenizer(["a photo of a tile"])),
+        "clip-image": (CLIP_MODEL_TAG, lambda: method_module(model, "encode_image"),
+                       torch.zeros(1, 3, *clip_image_size(model))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export encoders for TorchScript / ONNX Runtime serving")
+    parser.add_argument("--backends", nargs="+", default=["torchscript", "onnx", "onnx-int8"],
+                        choices=["torchscript", "onnx", "onnx-int8"])
+    parser.add_argument("--encoders", nargs="+", default=list(ENCODERS), choices=ENCODERS)
+    parser.add_argument("--out", default=MODEL_EXPORT_DIR, help="export directory")
+    args = parser.parse_args()
+
+    specs = encoder_specs()
+    for name in args.encoders:
+        model_tag, build_module, example = specs[name]
+        for backend in args.backends:
+            try:
+                export_encoder(name, model_tag, build_module(), example, backend, export_dir=args.out)
+            except Exception as e:
+                print(f"⚠️ Could not export {name} for {backend}: {e}")
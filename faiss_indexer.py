@@ -1,72 +1,106 @@
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet18
-from PIL import Image
+import os
+import json
 import numpy as np
 import faiss
-import os
-import pickle
-from config import TILE_FOLDER
+from fileio import atomic_write
+from config import (
+    FAISS_INDEX_TYPE,
+    FAISS_NLIST,
+    FAISS_NPROBE,
+    FAISS_HNSW_M,
+    FAISS_EF_CONSTRUCTION,
+    FAISS_EF_SEARCH,
+)
+
+# -----------------------
+# 🔹 FAISS search backend
+# -----------------------
+# Inner-product search over L2-normalized rows, so FAISS scores are the same
+# cosine similarities the numpy backend returns and `min_threshold` keeps
+# its meaning. Selected with SEARCH_BACKEND=faiss.
+
 
-# Load model
-model = resnet18(pretrained=True)
-model = torch.nn.Sequential(*list(model.children())[:-1])
-model.eval()
+def build_faiss_index(vectors, index_type=FAISS_INDEX_TYPE):
+    """Build a flat / IVF / HNSW inner-product index over normalized float32 rows."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
 
-# Transform input image
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225])
-])
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "ivf":
+        # ~39 training points per list is the FAISS minimum for stable centroids
+        nlist = max(1, min(FAISS_NLIST, n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
 
+    index.add(vectors)
+    return index
 
-def extract_feature(image_path):
+
+def _faiss_paths(index_dir, index_type):
+    return (os.path.join(index_dir, f"faiss_{index_type}.index"),
+            os.path.join(index_dir, f"faiss_{index_type}.json"))
+
+
+def load_faiss_index(index_dir, index_id, index_type=FAISS_INDEX_TYPE):
+    """
+    FAISS index saved by build_and_save_faiss_index as faiss_<type>.index
+    inside `index_dir`, or None if it is missing or belongs to another build.
+    """
+    if not index_dir:
+        return None
+    index_path, meta_path = _faiss_paths(index_dir, index_type)
     try:
-        img = Image.open(image_path).convert('RGB')
-    except Exception as e:
-        print(f"⚠️ Failed to open {image_path}: {e}")
-        return np.zeros(512)
-
-    tensor = transform(img).unsqueeze(0)
-    with torch.no_grad():
-        feature = model(tensor).squeeze().numpy()
-    return feature.reshape(1, -1)
-
-
-def build_faiss_index():
-    index = faiss.IndexFlatL2(512)
-    tile_map = []
-    features = []
-
-    for fname in os.listdir(TILE_FOLDER):
-        path = os.path.join(TILE_FOLDER, fname)
-        vec = extract_feature(path)
-        if vec is not None:
-            index.add(vec)
-            tile_map.append(fname)
-            features.append(vec)
-
-    # Save index and filenames
-    with open("tile_map.pkl", "wb") as f:
-        pickle.dump(tile_map, f)
-    faiss.write_index(index, "tiles.index")
-    print(f"✅ Indexed {len(tile_map)} tiles")
-
-
-def search_similar(image_path, top_k=5, threshold=0.6):
-    index = faiss.read_index("tiles.index")
-    with open("tile_map.pkl", "rb") as f:
-        tile_map = pickle.load(f)
-
-    query_vec = extract_feature(image_path)
-    distances, indices = index.search(query_vec, top_k)
-
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        similarity = 1 / (1 + dist)  # Convert L2 to similarity (optional)
-        if similarity >= threshold:
-            results.append((tile_map[idx], similarity))
-
-    return results
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("index_id") == index_id:
+                return faiss.read_index(index_path)
+    except (FileNotFoundError, ValueError, RuntimeError):
+        pass
+    return None
+
+
+def build_and_save_faiss_index(index_dir, index_id, vectors, index_type=FAISS_INDEX_TYPE):
+    """
+    Build a FAISS index for `vectors` and save it inside `index_dir`, tied to
+    the index's header id. Runs at index build time; serving processes only
+    load_faiss_index.
+    """
+    print(f"🔧 Building FAISS {index_type} index for {len(vectors)} vectors...")
+    index = build_faiss_index(vectors, index_type)
+
+    if index_dir:
+        index_path, meta_path = _faiss_paths(index_dir, index_type)
+        try:
+            with atomic_write(index_path) as f:
+                f.write(faiss.serialize_index(index).tobytes())
+            with atomic_write(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"index_id": index_id, "type": index_type}, f)
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️ Could not persist FAISS index in {index_dir}: {e}")
+    return index
+
+
+class FaissSearcher:
+    """Resident FAISS index with its query-time knobs (nprobe for IVF, efSearch for HNSW)."""
+
+    def __init__(self, index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH):
+        self.index = index
+        self.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        # Not safe to change while other threads are searching; set at load time
+        if nprobe is not None and hasattr(self.index, "nprobe"):
+            self.index.nprobe = nprobe
+        if ef_search is not None and hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = ef_search
+
+    def search(self, queries, k):
+        """(m, dim) normalized queries -> (scores, row ids), each (m, k); missing hits have id -1."""
+        k = min(k, self.index.ntotal)
+        return self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
@@ -0,0 +1,32 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# -----------------------
+# 🔹 Atomic file writes
+# -----------------------
+# Index files, caches and records are read by other processes while they are
+# rewritten, so every writer goes through a temp file that replaces the
+# target in one os.replace: readers see the old file or the new one, never
+# a partial write.
+
+
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    """
+    Open a temp file next to `path` for writing; it replaces `path` when the
+    block exits cleanly and is removed if it raises. The temp name carries
+    the pid and thread id (and ends in .tmp), so concurrent writers never
+    share one.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
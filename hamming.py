@@ -0,0 +1,81 @@
+# -----------------------
+# 🔹 Hamming near-duplicate index (64-bit hashes)
+# -----------------------
+# Multi-index hashing: the 64 bits are split into radius + 1 bands. If two
+# hashes differ in at most `radius` bits, at least one band is identical
+# (pigeonhole), so exact band lookups give every candidate and only those
+# are checked with a popcount.
+HASH_BITS = 64
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def hash_from_bits(bits):
+    """Legacy '0'/'1' hash strings -> int (first character is the most significant bit)."""
+    if bits is None or isinstance(bits, int):
+        return bits
+    return int(bits, 2)
+
+
+def _bands(radius):
+    count = min(radius + 1, HASH_BITS)
+    width, extra = divmod(HASH_BITS, count)
+    bands, shift = [], 0
+    for i in range(count):
+        w = width + (1 if i < extra else 0)
+        bands.append((shift, (1 << w) - 1))
+        shift += w
+    return bands
+
+
+class HammingIndex:
+    """Maps 64-bit hashes to values; finds stored hashes within `radius` bits."""
+
+    def __init__(self, radius=0):
+        self.radius = max(0, int(radius))
+        self._bands = _bands(self.radius)
+        self._tables = [{} for _ in self._bands]
+        self._exact = {}
+        self._items = []  # (hash, value) in insertion order
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, h, value):
+        item = len(self._items)
+        self._items.append((h, value))
+        self._exact.setdefault(h, value)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((h >> shift) & mask, []).append(item)
+
+    def exact(self, h):
+        """Value of the first hash added equal to `h`, or None."""
+        return self._exact.get(h)
+
+    def near(self, h):
+        """[(value, distance)] for stored hashes within `radius` bits, closest first."""
+        if self.radius == 0:
+            value = self._exact.get(h)
+            return [] if value is None else [(value, 0)]
+
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            candidates.update(table.get((h >> shift) & mask, ()))
+
+        hits = []
+        for item in sorted(candidates):
+            stored, value = self._items[item]
+            distance = hamming_distance(h, stored)
+            if distance <= self.radius:
+                hits.append((distance, item, value))
+        return [(value, distance) for distance, _, value in sorted(hits)]
+
+    def find(self, h):
+        """Closest stored value within `radius` bits (exact matches first), or None."""
+        value = self._exact.get(h)
+        if value is not None:
+            return value
+        hits = self.near(h)
+        return hits[0][0] if hits else None
@@ -0,0 +1,184 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from cache import content_digest
+from fileio import atomic_write
+from config import IMAGE_CACHE_DERIVATIVE_SIZE, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES
+
+# -----------------------
+# 🔹 Local cache of S3 catalog images
+# -----------------------
+# Catalog images are stored on disk under a digest of (S3 key, ETag). A new
+# upload under the same key gets a new ETag and therefore a new entry, so a
+# hit is always the current object. Reindexing after a model or
+# preprocessing change then reads from disk instead of S3. Entries are
+# evicted least recently used first (file mtime is bumped on every hit, so
+# the order survives restarts) once the cache exceeds `max_bytes`.
+#
+# With `derivative_size`, images are stored downscaled so their shorter
+# side is `derivative_size` px (lossless PNG) instead of the original bytes.
+# That is a fraction of the disk, but vectors embedded from a derivative
+# differ slightly from ones embedded from the original; entries for each
+# size live in their own subdirectory, so switching never mixes them. A
+# derivative records the content digest of the original bytes in a PNG text
+# chunk, so ingest still stores the digest an upload of the original has
+# (see source_digest).
+SOURCE_DIGEST_TEXT = "source_digest"
+
+
+def make_derivative(data, size):
+    """Image bytes -> PNG bytes with the shorter side scaled down to `size` (unchanged if already smaller)."""
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+    image = Image.open(BytesIO(data))
+    w, h = image.size
+    if min(w, h) <= size:
+        return data
+    scale = size / min(w, h)
+    image = image.convert("RGB").resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.Resampling.LANCZOS)
+    info = PngInfo()
+    info.add_text(SOURCE_DIGEST_TEXT, content_digest(data))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def source_digest(data, image):
+    """
+    content_digest of the original object for bytes `data` (opened as PIL
+    `image`) that may be a cached derivative.
+    """
+    return image.info.get(SOURCE_DIGEST_TEXT) or content_digest(data)
+
+
+class ImageCache:
+    def __init__(self, cache_dir, max_bytes, derivative_size=0):
+        self.root = os.path.join(cache_dir, f"short{derivative_size}" if derivative_size else "original")
+        self.max_bytes = max_bytes
+        self.derivative_size = derivative_size
+        self._lock = threading.Lock()
+        self._entries = None  # path -> size, least recently used first (scanned on first use)
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key, etag):
+        digest = hashlib.sha256(f"{key}\n{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _index(self):
+        """LRU table of what is on disk; call with the lock held."""
+        if self._entries is None:
+            found = []
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((st.st_mtime_ns, path, st.st_size))
+            found.sort()
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def _touch(self, path, size):
+        entries = self._index()
+        self._total += size - entries.pop(path, 0)
+        entries[path] = size
+
+    def _evict(self, keep):
+        entries = self._index()
+        while self._total > self.max_bytes and entries:
+            path, size = next(iter(entries.items()))
+            if path == keep:
+                break  # the entry just written is the most recent; only it is left
+            entries.pop(path)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another process evicted it first
+
+    def get(self, key, etag):
+        """Cached bytes for this (key, ETag), or None."""
+        path = self._path(key, etag)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                if self._entries is not None and path in self._entries:
+                    self._total -= self._entries.pop(path)
+            return None
+        with self._lock:
+            self.hits += 1
+            self._touch(path, len(data))
+        return data
+
+    def put(self, key, etag, data):
+        """
+        Store freshly downloaded bytes and return what was stored (the
+        derivative in derivative mode), so a first build decodes exactly
+        what later rebuilds will read back.
+        """
+        if self.derivative_size:
+            try:
+                data = make_derivative(data, self.derivative_size)
+            except Exception as e:
+                print(f"⚠️ Could not make a derivative of {key}, caching the original: {e}")
+        if len(data) > self.max_bytes:
+            return data
+
+        path = self._path(key, etag)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Temp names end in .tmp, which _index skips
+            with atomic_write(path) as f:
+                f.write(data)
+        except OSError as e:
+            print(f"⚠️ Could not cache {key}: {e}")
+            return data
+        with self._lock:
+            self._touch(path, len(data))
+            self._evict(keep=path)
+        return data
+
+    def stats(self):
+        with self._lock:
+            entries = self._index()
+            return {
+                "dir": self.root,
+                "entries": len(entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "derivative_size": self.derivative_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """The shared cache, or None if IMAGE_CACHE_DIR is empty."""
+    global _cache
+    if not IMAGE_CACHE_DIR or IMAGE_CACHE_MAX_BYTES <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_DERIVATIVE_SIZE)
+    return _cache
@@ -1,321 +1,692 @@
-import os
-import joblib
+import threading
 import numpy as np
+from contextlib import ExitStack
 from io import BytesIO
 from PIL import Image
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import resnet18, ResNet18_Weights
-import boto3
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
-import pandas as pd
+from batcher import MicroBatcher
+from cache import QueryResultCache, content_digest
+from clip_matcher import encode_images_batch, get_clip_model
+from hamming import HammingIndex, hash_from_bits
+from image_cache import source_digest
+from inference import load_encoder
+from ingest import StageTimer
+from metrics import span, watch_index
+from records import ResponseRecords, write_records
+from reindex import run_in_subprocess
+from worker_pool import get_inference_pool
+from utils import open_image
+from s3_store import iter_inventory, iter_downloads
+from index_store import (
+    build_lock,
+    digest_list,
+    hash_list,
+    index_stamp,
+    is_index_dir,
+    new_version_dir,
+    new_version_name,
+    publish_version,
+    read_index,
+    resolve_index_dir,
+    write_index,
+)
+from vector_index import VectorIndex, greedy_dedup, normalize_rows, prepare_search_artifacts
 from config import (
-    AWS_ACCESS_KEY_ID,
-    AWS_SECRET_ACCESS_KEY,
-    AWS_DEFAULT_REGION,
-    AWS_BUCKET,
-    AWS_URL,
-    S3_FOLDER,
-    PRODUCTS_EXCEL_KEY,
-    PRODUCTS_EXCEL_SHEET,
+    CLIP_INDEX_DIR,
+    CLIP_MODEL_TAG,
+    INDEX_BUILD_IN_SUBPROCESS,
+    INDEX_DIR,
+    INDEX_FILE,
+    INDEX_KEEP_VERSIONS,
+    INFERENCE_BATCHING,
+    INFERENCE_BATCH_WAIT_MS,
+    INFERENCE_MAX_BATCH,
+    INGEST_BATCH_SIZE,
+    INGEST_WORKERS,
+    INGEST_CLIP_INDEX,
+    HASH_DEDUP_RADIUS,
+    HASH_DEDUP_COSINE,
+    EXACT_MATCH_COSINE,
+    IMAGE_QUERY_CACHE_SIZE,
+    RESNET_BACKEND,
+    RESNET_MODEL_TAG,
 )
 
-# -----------------------
-# 🔹 S3 Client
-# -----------------------
-def init_s3_client():
-    try:
-        session = boto3.session.Session(
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_DEFAULT_REGION,
-        )
-        s3 = session.client("s3")
-        # test connection (small call)
-        s3.list_objects_v2(Bucket=AWS_BUCKET, Prefix=S3_FOLDER, MaxKeys=1)
-        print(f"✅ Connected to S3 bucket: {AWS_BUCKET}/{S3_FOLDER}")
-        return s3
-    except (NoCredentialsError, PartialCredentialsError):
-        raise RuntimeError("❌ AWS credentials not configured properly")
-    except ClientError as e:
-        raise RuntimeError(f"❌ AWS Client error: {e}")
-
-s3_client = init_s3_client()
-
 # -----------------------
 # 🔹 ResNet18 Feature Extractor
 # -----------------------
+# Loaded on first use under _model_lock (see inference.py)
+_model_lock = threading.RLock()
+
+
 def get_resnet_model():
     if not hasattr(get_resnet_model, "model"):
-        weights = ResNet18_Weights.DEFAULT
-        model = resnet18(weights=weights)
-        model = torch.nn.Sequential(*list(model.children())[:-1])
-        model.eval()
-        get_resnet_model.model = model
+        with _model_lock:
+            if not hasattr(get_resnet_model, "model"):
+                import torch
+                from torchvision.models import resnet18, ResNet18_Weights
+                weights = ResNet18_Weights.DEFAULT
+                model = resnet18(weights=weights)
+                # Drop the classifier; Flatten turns the pooled (n, 512, 1, 1) output into (n, 512)
+                model = torch.nn.Sequential(*list(model.children())[:-1], torch.nn.Flatten(1))
+                model.eval()
+                get_resnet_model.model = model
     return get_resnet_model.model
 
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225]
-    )
-])
+def get_resnet_encoder():
+    """ResNet18 feature extractor on the configured RESNET_BACKEND (see inference.py)."""
+    if not hasattr(get_resnet_encoder, "runner"):
+        with _model_lock:
+            if not hasattr(get_resnet_encoder, "runner"):
+                import torch
+                get_resnet_encoder.runner = load_encoder(
+                    "resnet18", RESNET_MODEL_TAG, get_resnet_model,
+                    torch.zeros(1, 3, 224, 224), RESNET_BACKEND,
+                )
+    return get_resnet_encoder.runner
+
+def get_transform():
+    if not hasattr(get_transform, "transform"):
+        import torchvision.transforms as transforms
+        get_transform.transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(
+                mean=[0.485, 0.456, 0.406],
+                std=[0.229, 0.224, 0.225]
+            )
+        ])
+    return get_transform.transform
 
 # -----------------------
 # 🔹 Feature Extraction
 # -----------------------
+def preprocess_image(image, crop_to_center=False):
+    """RGB PIL image -> normalized 3x224x224 tensor for the ResNet18 extractor."""
+    if crop_to_center:
+        w, h = image.size
+        min_dim = min(w, h)
+        image = image.crop((
+            (w - min_dim) // 2,
+            (h - min_dim) // 2,
+            (w + min_dim) // 2,
+            (h + min_dim) // 2
+        ))
+
+    image = image.resize((224, 224))
+    return get_transform()(image)
+
+def extract_features_batch(tensors):
+    """One forward pass over a list of preprocessed tensors -> (n, 512) feature array."""
+    import torch
+    return get_resnet_encoder()(torch.stack(list(tensors)))
+
+# Concurrent requests share one forward pass (see INFERENCE_BATCH_WAIT_MS)
+feature_batcher = MicroBatcher(
+    "resnet", extract_features_batch,
+    max_batch_size=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+)
+
 def extract_features(image_input, crop_to_center=False):
     try:
-        if isinstance(image_input, str):
-            image = Image.open(image_input).convert("RGB")
-        elif isinstance(image_input, Image.Image):
-            image = image_input.convert("RGB")
-        else:
-            raise ValueError("Unsupported image input type")
-
-        if crop_to_center:
-            w, h = image.size
-            min_dim = min(w, h)
-            image = image.crop((
-                (w - min_dim) // 2,
-                (h - min_dim) // 2,
-                (w + min_dim) // 2,
-                (h + min_dim) // 2
-            ))
-
-        image = image.resize((224, 224))
+        image = open_image(image_input, "RGB")
+        tensor = preprocess_image(image, crop_to_center=crop_to_center)
     except Exception as e:
         print(f"⚠️ Error loading image: {e}")
         return np.zeros(512)
 
-    tensor = transform(image).unsqueeze(0)
-    model = get_resnet_model()
-    with torch.no_grad():
-        features = model(tensor).squeeze()
-    return features.numpy()
+    if INFERENCE_BATCHING:
+        return feature_batcher(tensor)
+    return extract_features_batch([tensor])[0]
 
 # -----------------------
 # 🔹 Image Hash (dedupe)
 # -----------------------
 def compute_hash(image_input):
+    """64-bit average hash as an int (bit 63 = top-left pixel), or None if the image can't be read."""
     try:
-        if isinstance(image_input, str):
-            image = Image.open(image_input).convert("L").resize((8, 8), Image.Resampling.LANCZOS)
-        elif isinstance(image_input, Image.Image):
-            image = image_input.convert("L").resize((8, 8), Image.Resampling.LANCZOS)
-        else:
-            raise ValueError("Unsupported image input type")
+        image = open_image(image_input, "L").resize((8, 8), Image.Resampling.LANCZOS)
 
         pixels = np.array(image)
         avg = pixels.mean()
         bits = pixels > avg
-        return ''.join(['1' if b else '0' for b in bits.flatten()])
+        return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
     except Exception as e:
         print(f"⚠️ Could not hash image: {e}")
         return None
 
 # -----------------------
-# 🔹 List Images from S3
-# -----------------------
-def list_images():
-    resp = s3_client.list_objects_v2(Bucket=AWS_BUCKET, Prefix=S3_FOLDER)
-    return [
-        ("s3", item["Key"])
-        for item in resp.get("Contents", [])
-        if item["Key"].lower().endswith((".png", ".jpg", ".jpeg"))
-    ]
-
-def load_image_from_s3(key):
-    obj = s3_client.get_object(Bucket=AWS_BUCKET, Key=key)
-    return Image.open(BytesIO(obj["Body"].read())).convert("RGB")
-
-# -----------------------
-# 🔹 Product mapping (Excel)
+# 🔹 Build Index
 # -----------------------
-_product_map = None
-_product_map_last_modified = None
-
-def load_product_mapping(force=False):
+def _embed_s3_images(keys, seen, timer, with_clip=False, etags=None):
     """
-    Loads the Excel products file from S3 and builds a mapping:
-      basename (e.g. GP00091_b.jpg) -> { title, slug, sizes, category }
-    Caches the mapping and reloads if the S3 object's LastModified changes.
+    Download and decode each of `keys` once on a bounded worker pool; from
+    that one decode compute the perceptual hash, the ResNet18 tensor and
+    (with `with_clip`) the CLIP tensor, while the main thread embeds them in
+    batches of INGEST_BATCH_SIZE. Keys are consumed in order, so hash dedupe
+    matches processing images one at a time. An image whose hash is within
+    HASH_DEDUP_RADIUS bits of one already in `seen` (a HammingIndex) is still
+    embedded, with that image's key as its duplicate `candidate`; the caller
+    confirms it by cosine similarity, and adds its hash to `seen` if it is
+    not a duplicate after all. Yields `(key, image_hash, digest, features,
+    clip_features, candidate)` (`digest` is the content_digest of the
+    original object bytes, see image_cache.source_digest); both feature
+    vectors are None for blank and unhashable images. Keys that fail to
+    download are skipped. Keys with an ETag in `etags` go through the local
+    image cache.
     """
-    global _product_map, _product_map_last_modified
+    clip_preprocess = get_clip_model()[1] if with_clip else None
+
+    def decode(key, data):
+        with timer.time("decode+hash+preprocess"):
+            image = Image.open(BytesIO(data))
+            # Digest of the original object even when `data` is a cached derivative
+            digest = source_digest(data, image)
+            image = image.convert("RGB")
+            clip_tensor = clip_preprocess(image) if clip_preprocess is not None else None
+            return compute_hash(image), digest, (preprocess_image(image), clip_tensor)
+
+    def unique_images():
+        for key, result, error in iter_downloads(
+            keys, process=decode, workers=INGEST_WORKERS, timer=timer, etags=etags,
+        ):
+            if error is not None:
+                print(f"⚠️ Error processing {key}: {error}")
+                continue
+            image_hash, digest, tensors = result
+            if image_hash is None:
+                yield key, image_hash, digest, None, None
+                continue
+            candidate = seen.find(image_hash)
+            if candidate is None:
+                seen.add(image_hash, key)
+            yield key, image_hash, digest, tensors, candidate
+
+    def embed(batch):
+        with timer.time("embed", len(batch)):
+            features = extract_features_batch([tensors[0] for _, _, _, tensors, _ in batch])
+        if not with_clip:
+            return [(feats, None) for feats in features]
+        with timer.time("clip_embed", len(batch)):
+            clip_features = encode_images_batch([tensors[1] for _, _, _, tensors, _ in batch])
+        return list(zip(features, clip_features))
+
+    pending = []
+    for key, image_hash, digest, tensors, candidate in unique_images():
+        if tensors is None:
+            yield key, image_hash, digest, None, None, None
+            continue
+        pending.append((key, image_hash, digest, tensors, candidate))
+        if len(pending) >= INGEST_BATCH_SIZE:
+            yield from _embedded(pending, embed, with_clip)
+            pending = []
+    if pending:
+        yield from _embedded(pending, embed, with_clip)
+
+def _embedded(batch, embed, with_clip):
     try:
-        head = s3_client.head_object(Bucket=AWS_BUCKET, Key=PRODUCTS_EXCEL_KEY)
-        last_mod = head.get("LastModified")
-
-        if not force and _product_map is not None and last_mod == _product_map_last_modified:
-            return _product_map
-
-        obj = s3_client.get_object(Bucket=AWS_BUCKET, Key=PRODUCTS_EXCEL_KEY)
-        data = obj["Body"].read()
-
-        # Try sheet named PRODUCTS_EXCEL_SHEET first, else fallback to first sheet
-        try:
-            df = pd.read_excel(BytesIO(data), sheet_name=PRODUCTS_EXCEL_SHEET, engine="openpyxl")
-        except Exception:
-            df = pd.read_excel(BytesIO(data), sheet_name=0, engine="openpyxl")
-
-        # Normalize columns (case-insensitive)
-        cols = {c.lower(): c for c in df.columns}
-
-        images_col = cols.get('images', None)
-        title_col = cols.get('product title', None) or cols.get('producttitle', None) or cols.get('title', None)
-        slug_col = cols.get('slug name', None) or cols.get('slugname', None) or cols.get('slug', None)
-        sizes_col = cols.get('sizes', None) or cols.get('size', None) or cols.get('size(s)', None)
-        category_col = cols.get('category', None) or cols.get('categories', None)
-
-        mapping = {}
-
-        if images_col is None:
-            print("⚠️ Products excel: 'Images' column not found. Product mapping will be empty.")
-            _product_map = mapping
-            _product_map_last_modified = last_mod
-            return mapping
-
-        for _, row in df.iterrows():
-            try:
-                images_field = row.get(images_col, "")
-                title = row.get(title_col, "") if title_col else ""
-                slug = row.get(slug_col, "") if slug_col else ""
-                sizes = row.get(sizes_col, "") if sizes_col else ""
-                category = row.get(category_col, "") if category_col else ""
-
-                # normalize NaN -> ""
-                title = "" if pd.isna(title) else str(title).strip()
-                slug = "" if pd.isna(slug) else str(slug).strip()
-                sizes = "" if pd.isna(sizes) else str(sizes).strip()
-                category = "" if pd.isna(category) else str(category).strip()
-
-                if pd.isna(images_field):
-                    continue
-
-                # images_field may be comma-separated
-                if isinstance(images_field, str):
-                    parts = [p.strip() for p in images_field.split(",") if p.strip()]
-                elif isinstance(images_field, (list, tuple)):
-                    parts = images_field
-                else:
-                    parts = [str(images_field).strip()]
-
-                for p in parts:
-                    basename = os.path.basename(p)
-                    mapping[basename.lower()] = {
-                        "title": title,
-                        "slug": slug,
-                        "sizes": sizes,
-                        "category": category
-                    }
-            except Exception as e:
-                print(f"⚠️ Error parsing row in products excel: {e}")
-
-        _product_map = mapping
-        _product_map_last_modified = last_mod
-        print(f"✅ Loaded product mapping for {len(mapping)} image filenames from Excel.")
-        return mapping
+        batch_features = embed(batch)
     except Exception as e:
-        print(f"⚠️ Could not load products excel from S3: {e}")
-        _product_map = {}
-        _product_map_last_modified = None
-        return _product_map
+        print(f"⚠️ Error embedding batch starting at {batch[0][0]}: {e}")
+        return
+    for (key, image_hash, digest, _, candidate), (feats, clip_feats) in zip(batch, batch_features):
+        blank = np.linalg.norm(feats) == 0 or (with_clip and np.linalg.norm(clip_feats) == 0)
+        yield key, image_hash, digest, (None if blank else feats), (None if blank else clip_feats), candidate
 
-def get_product_info_for_filename(filename):
+def _confirmed_duplicate(features, kept_row):
+    """
+    True if `features` are within HASH_DEDUP_COSINE of the kept row's vector.
+    Colour variants of one pattern share the 8x8 grayscale hash, so a hash
+    match alone must not drop an image (see `_query_vector`).
+    """
+    if kept_row is None:
+        return False
+    a = normalize_rows(np.asarray(features).reshape(-1))[0]
+    b = normalize_rows(np.asarray(kept_row["features"]).reshape(-1))[0]
+    return float(a @ b) >= HASH_DEDUP_COSINE
+
+def _load_index_rows():
+    """Existing index rows as {key: row}, plus the skipped-key table."""
+    source = _image_index.source()
+    if source is None:
+        return {}, {}
+    try:
+        payload = read_index(source)
+    except Exception as e:
+        print(f"⚠️ Could not read {source}, rebuilding from scratch: {e}")
+        return {}, {}
+
+    names = payload["names"]
+    # Legacy (names, features) files have no ETags, so every row counts as changed
+    etags = payload.get("etags") or [None] * len(names)
+    last_modified = payload.get("last_modified") or [None] * len(names)
+    hashes = hash_list(payload["hashes"]) if payload.get("hashes") is not None else [None] * len(names)
+    digests = digest_list(payload["digests"]) if payload.get("digests") is not None else [None] * len(names)
+    rows = {
+        key: {"features": feats, "etag": etag, "last_modified": lm, "hash": h, "digest": digest}
+        for key, feats, etag, lm, h, digest in zip(names, payload["features"], etags, last_modified, hashes, digests)
+    }
+    return rows, payload.get("skipped", {})
+
+def _load_clip_rows():
+    """
+    Existing CLIP vectors as {S3 key: (ETag, vector)}. The ETag is the one
+    the vector was embedded from; the caller only reuses a vector whose ETag
+    matches the image row's, since the two roots can diverge (a crash
+    between publishes, a rollback or prune of one root). Indexes built from
+    a local folder (build_clip_index) have no ETags and contribute nothing,
+    so the first single-pass update re-embeds everything.
+    """
+    if not is_index_dir(resolve_index_dir(CLIP_INDEX_DIR)):
+        return {}
+    try:
+        payload = read_index(CLIP_INDEX_DIR)
+    except Exception as e:
+        print(f"⚠️ Could not read {CLIP_INDEX_DIR}, re-embedding CLIP vectors: {e}")
+        return {}
+    etags = payload.get("etags")
+    if payload["header"].get("model") != CLIP_MODEL_TAG or etags is None:
+        return {}
+    return {key: (etag, vector) for key, etag, vector in zip(payload["names"], etags, payload["features"])}
+
+def update_image_index(rebuild=False, with_clip=INGEST_CLIP_INDEX, wait=True):
+    """
+    `_update_image_index` under the build lock of every root it writes, so
+    concurrent builders never interleave (or prune each other's partial
+    versions). With `wait=False` it returns False at once if another build
+    holds the lock.
+    """
+    roots = [INDEX_DIR, CLIP_INDEX_DIR] if with_clip else [INDEX_DIR]
+    with ExitStack() as stack:
+        for root in roots:
+            if not stack.enter_context(build_lock(root, blocking=wait)):
+                print(f"⏭️ Another index build holds {root}, skipping")
+                return False
+        return _update_image_index(rebuild, with_clip)
+
+def _update_image_index(rebuild, with_clip):
     """
-    filename: basename (e.g. 'GP00091_b.jpg') or full key.
-    Returns tuple (title, slug, sizes, category). Returns empty strings if not found.
+    Bring the index in INDEX_DIR (and, with `with_clip`, the CLIP index in
+    CLIP_INDEX_DIR) in line with the S3 inventory. Each image is downloaded
+    and decoded once for the hash, the ResNet18 and the CLIP vector, and
+    both indexes are written with the same keys in the same order.
+    Each row stores its key's ETag/LastModified, so only new keys and keys
+    whose ETag changed are downloaded and embedded; deleted keys are dropped.
+    Keys skipped as duplicates (hash neighbours confirmed by cosine
+    similarity) or blank images are remembered with their ETag so they are
+    not re-downloaded on every pass. The index is
+    rewritten compacted, in listing order, and only if something changed.
+    Returns True if the index was written.
     """
-    mapping = load_product_mapping()
-    key = os.path.basename(filename).lower()
-    info = mapping.get(key)
-    if info:
-        return (
-            info.get("title", "") or "",
-            info.get("slug", "") or "",
-            info.get("sizes", "") or "",
-            info.get("category", "") or ""
+    timer = StageTimer("resnet_index")
+    with timer.time("list", 0):
+        inventory = list(iter_inventory())
+    current = {obj.key: obj for obj in inventory}
+    with timer.time("load_previous", 0):
+        old_rows, old_skipped = ({}, {}) if rebuild else _load_index_rows()
+        if with_clip and old_rows:
+            clip_rows = _load_clip_rows()
+            for key, row in old_rows.items():
+                clip_etag, clip_vector = clip_rows.get(key, (None, None))
+                row["clip"] = clip_vector if clip_etag is not None and clip_etag == row["etag"] else None
+
+    # A row is reused only if its ETag is unchanged and (with_clip) it has a CLIP vector too
+    rows = {
+        key: row for key, row in old_rows.items()
+        if key in current and row["etag"] is not None and row["etag"] == current[key].etag
+        and (not with_clip or row["clip"] is not None)
+    }
+    seen = HammingIndex(HASH_DEDUP_RADIUS)
+    for obj in inventory:
+        if obj.key in rows and rows[obj.key]["hash"] is not None:
+            seen.add(rows[obj.key]["hash"], obj.key)
+    # A skipped duplicate is re-embedded (and re-confirmed) once the row it
+    # duplicated is gone or changed; entries from before confirmation (no
+    # `duplicate_of`) are too. A blank or unhashable image stays skipped for
+    # as long as its ETag is unchanged.
+    skipped = {}
+    for key, entry in old_skipped.items():
+        if key not in current or entry["etag"] != current[key].etag:
+            continue
+        reason = entry.get("reason", "duplicate")
+        if reason == "duplicate" and entry.get("duplicate_of") not in rows:
+            continue
+        skipped[key] = dict(entry, hash=hash_from_bits(entry["hash"]), reason=reason)
+
+    to_embed = [obj.key for obj in inventory if obj.key not in rows and obj.key not in skipped]
+    removed = (set(old_rows) - set(rows)) | (set(old_skipped) - set(skipped))
+    print(f"📦 Found {len(inventory)} images (S3): {len(to_embed)} new/changed, "
+          f"{len(set(old_rows) - set(current))} deleted")
+
+    up_to_date = index_stamp(resolve_index_dir(INDEX_DIR)) is not None and (
+        not with_clip or index_stamp(resolve_index_dir(CLIP_INDEX_DIR)) is not None
+    )
+    if not to_embed and not removed and up_to_date:
+        return False
+
+    for key, image_hash, digest, feats, clip_feats, candidate in _embed_s3_images(
+        to_embed, seen, timer, with_clip=with_clip, etags={key: current[key].etag for key in to_embed},
+    ):
+        obj = current[key]
+        if feats is None:
+            reason = "blank" if image_hash is not None else "unhashable"
+            skipped[key] = {"etag": obj.etag, "hash": image_hash, "reason": reason}
+        elif candidate is not None and _confirmed_duplicate(feats, rows.get(candidate)):
+            skipped[key] = {"etag": obj.etag, "hash": image_hash, "reason": "duplicate", "duplicate_of": candidate}
+        else:
+            if candidate is not None:
+                # Same hash neighbourhood, different image: later ones may collapse into it too
+                seen.add(image_hash, key)
+            rows[key] = {
+                "features": feats, "clip": clip_feats,
+                "etag": obj.etag, "last_modified": obj.last_modified, "hash": image_hash, "digest": digest,
+            }
+
+    ordered = [obj.key for obj in inventory if obj.key in rows]
+    if not ordered:
+        if not old_rows:
+            print("❌ No valid images found to index.")
+            return False
+        # Every indexed image was deleted: publish an empty index rather than keep serving them
+        print("⚠️ No indexable images left in S3; publishing an empty index.")
+
+    # Written as a new version of each root and published once complete; a
+    # serving process switches on its next request, queries in flight finish
+    # on the snapshot they started with, older versions stay for rollback
+    version = new_version_name()
+    with timer.time("write", len(ordered)):
+        index_dir = new_version_dir(INDEX_DIR, version)
+        vectors = _stack(
+            [rows[key]["features"] for key in ordered],
+            lambda: len(next(iter(old_rows.values()))["features"]),
         )
-    return "", "", "", ""
-
-# -----------------------
-# 🔹 Build Index
-# -----------------------
-def build_image_index():
-    all_features = []
-    tile_names = []
-    seen_hashes = set()
-
-    images = list_images()
-    print(f"📦 Found {len(images)} images (S3)")
-
-    for _, key in images:
-        try:
-            image = load_image_from_s3(key)
-            image_hash = compute_hash(image)
-            if not image_hash or image_hash in seen_hashes:
-                continue
-            seen_hashes.add(image_hash)
-
-            feats = extract_features(image)
-            if np.linalg.norm(feats) != 0:
-                all_features.append(feats)
-                tile_names.append(key)
-        except Exception as e:
-            print(f"⚠️ Error processing {key}: {e}")
-
-    if not all_features:
-        print("❌ No valid images found to index.")
-        return
-
-    all_features = np.vstack(all_features)
-    joblib.dump((tile_names, all_features), "tile_index.pkl")
-    print("✅ Feature index saved as 'tile_index.pkl'.")
+        header = write_index(
+            index_dir,
+            ordered,
+            vectors,
+            RESNET_MODEL_TAG,
+            rows={
+                "etags": [rows[key]["etag"] for key in ordered],
+                "last_modified": [rows[key]["last_modified"] for key in ordered],
+                "hashes": [rows[key]["hash"] for key in ordered],
+                "digests": [rows[key]["digest"] for key in ordered],
+                "skipped": skipped,
+            },
+        )
+        write_records(index_dir, header["id"], ordered)
+        prepare_search_artifacts(index_dir, header["id"], vectors)
+        if with_clip:
+            # Same keys, same order: row i is the same catalog image in both indexes
+            clip_dir = new_version_dir(CLIP_INDEX_DIR, version)
+            clip_vectors = _stack([rows[key]["clip"] for key in ordered], _clip_dim)
+            clip_header = write_index(
+                clip_dir,
+                ordered,
+                clip_vectors,
+                CLIP_MODEL_TAG,
+                rows={"etags": [rows[key]["etag"] for key in ordered], "image_index_id": header["id"]},
+            )
+            write_records(clip_dir, clip_header["id"], ordered)
+            prepare_search_artifacts(clip_dir, clip_header["id"], clip_vectors)
+        publish_version(INDEX_DIR, version, keep=INDEX_KEEP_VERSIONS)
+        if with_clip:
+            publish_version(CLIP_INDEX_DIR, version, keep=INDEX_KEEP_VERSIONS)
+    timer.report("Catalog index update" if with_clip else "ResNet index update", len(to_embed))
+    print(f"✅ Feature index saved to '{index_dir}' ({len(ordered)} tiles).")
+    if with_clip:
+        print(f"✅ CLIP index saved to '{clip_dir}' ({len(ordered)} tiles, same key order).")
+    return True
+
+def _stack(vectors, dim):
+    """Normalized (n, dim) matrix; `dim()` gives the width when there are no rows."""
+    if not vectors:
+        return np.zeros((0, dim()), dtype=np.float32)
+    return normalize_rows(np.vstack(vectors))
+
+def _clip_dim():
+    return int(get_clip_model()[0].visual.output_dim)
+
+def build_image_index(with_clip=INGEST_CLIP_INDEX):
+    """Full rebuild: re-download and re-embed every image in the S3 inventory."""
+    update_image_index(rebuild=True, with_clip=with_clip)
 
 # -----------------------
 # 🔹 Similarity Search
 # -----------------------
-def cosine_similarity(a, b):
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
-def find_best_matches(uploaded_image_path, top_k=20, min_threshold=0.7, dedup_threshold=0.01):
-    if not os.path.exists("tile_index.pkl"):
-        build_image_index()
-
-    tile_names, feature_matrix = joblib.load("tile_index.pkl")
-
-    uploaded_vector = extract_features(uploaded_image_path, crop_to_center=True).reshape(-1)
+# Falls back to the legacy INDEX_FILE pickle until the first build/convert_index.py
+_image_index = VectorIndex(INDEX_DIR, legacy_path=INDEX_FILE, model=RESNET_MODEL_TAG)
+watch_index("image", _image_index)
+
+def _pin_exact_match(ids, scores, exact_row):
+    """Report `exact_row` first with score 1.0 (dropping it from its ranked position)."""
+    keep = ids != exact_row
+    return np.r_[exact_row, ids[keep]], np.r_[np.float32(1.0), scores[keep]]
+
+# Repeated uploads of the same bytes reuse results / query embeddings until the index changes
+image_query_cache = QueryResultCache(IMAGE_QUERY_CACHE_SIZE)
+
+# Ready-to-serve result dicts per row (see records.py)
+image_records = ResponseRecords(INDEX_DIR)
+
+def get_image_index():
+    index = _image_index.get()
+    if index is None:
+        # Cold start. Incremental and queued behind any running build, so a
+        # caller that waited on another process's build reuses its result
+        if INDEX_BUILD_IN_SUBPROCESS:
+            run_in_subprocess(wait=True)
+        else:
+            update_image_index()
+        index = _image_index.get()
+    return index
 
-    similarities = []
-    exact_match_found = False
+def _decode_query(index, uploaded_image):
+    """
+    -> (RGB image, row of a catalog image with the same perceptual hash or
+    None); image is None if undecodable. The row is only a candidate, see
+    `_query_vector`.
+    """
+    try:
+        image = open_image(uploaded_image, "RGB")
+    except Exception as e:
+        print(f"⚠️ Error loading image: {e}")
+        return None, None
+    query_hash = compute_hash(image)
+    return image, (index.hash_row(query_hash))
 
-    for idx, tile_vector in enumerate(feature_matrix):
-        sim = cosine_similarity(uploaded_vector, tile_vector)
+def _same_bytes(index, row, digest):
+    """True if the upload is byte-identical to the catalog image at `row` (digest recorded at ingest)."""
+    return index.same_digest(row, digest)
 
-        if not exact_match_found and sim >= 0.99999:
-            similarities.insert(0, (tile_names[idx], 1.0))
-            exact_match_found = True
-        elif sim >= min_threshold:
-            similarities.append((tile_names[idx], sim))
+def _query_vector(index, candidate_row, features, digest=None):
+    """
+    -> (normalized query, exact-match row or None); (None, None) for blank
+    features. A hash `candidate_row` only counts as an exact match if it is
+    confirmed: same bytes as that catalog image (then its stored vector is
+    the query and `features` may be None), or `features` within
+    EXACT_MATCH_COSINE of its stored vector. Colour variants of one pattern
+    share the 8x8 grayscale hash, so the hash alone is not enough.
+    """
+    if candidate_row is not None and _same_bytes(index, candidate_row, digest):
+        return np.asarray(index.vectors[candidate_row], dtype=np.float32), candidate_row
+    if features is None or np.linalg.norm(features) == 0:
+        return None, None
+    query = normalize_rows(np.asarray(features).reshape(-1))[0]
+    if candidate_row is not None and float(index.vectors[candidate_row] @ query) >= EXACT_MATCH_COSINE:
+        return query, candidate_row
+    return query, None
+
+def _embed_query(index, uploaded_image, digest=None):
+    """
+    Query vector for one upload: (normalized vector, exact-match row or None),
+    or (None, None) if the image can't be used. Raw bytes go to the inference
+    pool when one is configured (see worker_pool.py).
+    """
+    pool = get_inference_pool()
+    if pool is not None and isinstance(uploaded_image, (bytes, bytearray)):
+        with span("image.pool_embed"):
+            query_hash, features = pool.embed_images([uploaded_image])[0]
+        if query_hash is None and features is None:
+            return None, None
+        return _query_vector(index, index.hash_row(query_hash), features, digest)
+
+    with span("image.decode"):
+        image, candidate_row = _decode_query(index, uploaded_image)
+    if image is None:
+        return None, None
+    features = None
+    if candidate_row is None or not _same_bytes(index, candidate_row, digest):
+        with span("image.embed"):
+            features = extract_features(image, crop_to_center=True)
+    return _query_vector(index, candidate_row, features, digest)
+
+def _rank_matches(index, query, exact_row, top_k, min_threshold, dedup_threshold, first_pool=None):
+    """
+    Ranked, deduplicated [(row, score)] for one normalized query vector.
+    `first_pool` is an already computed (ids, scores) search for the initial pool.
+    """
+    # Widen the candidate pool only if deduplication leaves fewer than top_k results
+    pool = max(4 * top_k, 128)
+    while True:
+        if first_pool is not None:
+            ids, scores = first_pool
+            first_pool = None
+        else:
+            with span("image.search"):
+                ids, scores = index.search(query, pool, min_score=min_threshold)
+        if exact_row is not None:
+            ids, scores = _pin_exact_match(ids, scores, exact_row)
+        with span("image.dedup"):
+            kept = greedy_dedup(index.vectors, ids, top_k, dedup_threshold)
+        if len(kept) >= top_k or len(ids) < pool or pool >= len(index):
+            break
+        pool *= 4
 
-    # Deduplicate
-    deduped_results = []
-    seen_vectors = []
+    score_of = dict(zip(ids.tolist(), scores.tolist()))
+    return [(int(idx), score_of[idx]) for idx in kept]
 
-    for name, sim in sorted(similarities, key=lambda x: x[1], reverse=True):
-        vec = feature_matrix[tile_names.index(name)]
+def find_best_matches(uploaded_image, top_k=20, min_threshold=0.7, dedup_threshold=0.01):
+    """[(s3_key, score)] best first; see `find_best_match_rows`."""
+    index, matches = find_best_match_rows(uploaded_image, top_k, min_threshold, dedup_threshold)
+    return [(index.names[row], score) for row, score in matches]
 
-        is_duplicate = any(
-            cosine_similarity(vec, seen_vec) > (1 - dedup_threshold)
-            for seen_vec in seen_vectors
+def find_best_match_rows(uploaded_image, top_k=20, min_threshold=0.7, dedup_threshold=0.01):
+    """
+    `uploaded_image` may be a path, raw bytes, a file-like object or a PIL image.
+    Returns (index snapshot, [(row, score)] best first); rows index the
+    snapshot, e.g. for `image_records.gather`.
+    A catalog image re-uploaded as-is is recognised by its perceptual hash in
+    O(1) and reported first with score 1.0. If the bytes are identical to the
+    ingested image its stored vector is used as the query, skipping the
+    forward pass; otherwise the hash hit must be confirmed by cosine
+    similarity (see `_query_vector`).
+    """
+    index = get_image_index()
+    if index is None or len(index) == 0:
+        return index, []
+
+    digest = content_digest(uploaded_image)
+    params = (top_k, min_threshold, dedup_threshold)
+    if digest is not None:
+        cached = image_query_cache.get_result(index.version, digest, params)
+        if cached is not None:
+            return index, cached
+
+    cached_query = image_query_cache.get_query(index.version, digest) if digest is not None else None
+    if cached_query is not None:
+        query, exact_row = cached_query
+    else:
+        query, exact_row = _embed_query(index, uploaded_image, digest)
+        if query is None:
+            return index, []
+        if digest is not None:
+            image_query_cache.put_query(index.version, digest, query, exact_row)
+
+    results = _rank_matches(index, query, exact_row, top_k, min_threshold, dedup_threshold)
+    if digest is not None:
+        image_query_cache.put_result(index.version, digest, params, results)
+    return index, results
+
+def find_best_matches_batch(uploaded_images, top_k=20, min_threshold=0.7, dedup_threshold=0.01):
+    """[[(s3_key, score)], ...] per input; see `find_best_match_rows_batch`."""
+    index, all_matches = find_best_match_rows_batch(uploaded_images, top_k, min_threshold, dedup_threshold)
+    return [[(index.names[row], score) for row, score in matches] for matches in all_matches]
+
+def find_best_match_rows_batch(uploaded_images, top_k=20, min_threshold=0.7, dedup_threshold=0.01):
+    """
+    `find_best_match_rows` for many images: the images that need embedding
+    share batched forward passes, and all queries are scored against the
+    index with one matrix-matrix product. Returns (index snapshot, one
+    [(row, score)] list per input), empty where the image could not be read.
+    """
+    results = [[] for _ in uploaded_images]
+    index = get_image_index()
+    if index is None or len(index) == 0:
+        return index, results
+
+    params = (top_k, min_threshold, dedup_threshold)
+    digests = [content_digest(uploaded_image) for uploaded_image in uploaded_images]
+    queries = [None] * len(uploaded_images)
+    exact_rows = [None] * len(uploaded_images)
+    pending = []
+    for i in range(len(uploaded_images)):
+        if digests[i] is not None:
+            cached = image_query_cache.get_result(index.version, digests[i], params)
+            if cached is not None:
+                results[i] = cached
+                continue
+            cached_query = image_query_cache.get_query(index.version, digests[i])
+            if cached_query is not None:
+                queries[i], exact_rows[i] = cached_query
+                continue
+        pending.append(i)
+
+    pool = get_inference_pool()
+    if pool is not None and all(digests[i] is not None for i in pending):
+        # Raw bytes: decode, hash and embed in the worker processes
+        with span("image.pool_embed_batch"):
+            embedded = pool.embed_images([uploaded_images[i] for i in pending])
+        for i, (query_hash, features) in zip(pending, embedded):
+            if query_hash is not None or features is not None:
+                queries[i], exact_rows[i] = _query_vector(
+                    index, index.hash_row(query_hash), features, digests[i],
+                )
+    else:
+        to_embed = []
+        for i in pending:
+            with span("image.decode"):
+                image, exact_rows[i] = _decode_query(index, uploaded_images[i])
+            if image is None:
+                continue
+            if exact_rows[i] is not None and _same_bytes(index, exact_rows[i], digests[i]):
+                queries[i], exact_rows[i] = _query_vector(index, exact_rows[i], None, digests[i])
+                continue
+            try:
+                to_embed.append((i, preprocess_image(image, crop_to_center=True)))
+            except Exception as e:
+                print(f"⚠️ Error loading image: {e}")
+
+        for start in range(0, len(to_embed), INGEST_BATCH_SIZE):
+            batch = to_embed[start:start + INGEST_BATCH_SIZE]
+            with span("image.embed_batch"):
+                features = extract_features_batch([tensor for _, tensor in batch])
+            for (i, _), feats in zip(batch, features):
+                # exact_rows[i] still holds the unconfirmed hash candidate here
+                queries[i], exact_rows[i] = _query_vector(index, exact_rows[i], feats, digests[i])
+
+    for i in pending:
+        if queries[i] is not None and digests[i] is not None:
+            image_query_cache.put_query(index.version, digests[i], queries[i], exact_rows[i])
+
+    live = [i for i, query in enumerate(queries) if query is not None]
+    if not live:
+        return index, results
+    pool = max(4 * top_k, 128)
+    with span("image.search_batch"):
+        first_pools = index.search_batch(np.vstack([queries[i] for i in live]), pool, min_score=min_threshold)
+    for i, first_pool in zip(live, first_pools):
+        results[i] = _rank_matches(
+            index, queries[i], exact_rows[i], top_k, min_threshold, dedup_threshold, first_pool=first_pool
         )
-        if not is_duplicate:
-            deduped_results.append((name, sim))
-            seen_vectors.append(vec)
-
-        if len(deduped_results) >= top_k:
-            break
-
-    return deduped_results
+        if digests[i] is not None:
+            image_query_cache.put_result(index.version, digests[i], params, results[i])
+    return index, results
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from contextlib import contextmanager
+import joblib
+import numpy as np
+from fileio import atomic_write
+from hamming import hash_from_bits
+
+# -----------------------
+# 🔹 On-disk index format
+# -----------------------
+# An index is a directory:
+#   header.json  - format/version, model tag, dim, count, dtype (written last)
+#   vectors.npy  - (count, dim) float32 block, rows L2-normalized
+#   keys.json    - row -> key table
+#   hashes.npy   - optional (count,) uint64 perceptual hashes (0 = none)
+#   digests.npy  - optional (count,) content digests of the ingested bytes
+#   rows.json    - optional builder-only metadata (etags, skipped keys, ...)
+#   records.json - optional per-row response records (see records.py)
+# The .npy files are opened with np.memmap, so every worker process maps the
+# same page-cache pages instead of unpickling a private copy; rows.json is
+# only parsed by index builds.
+#
+# Builds write a versioned root instead of rewriting files in place:
+#   CURRENT            - name of the live version (replaced atomically)
+#   versions/<name>/   - one complete index directory per build
+# A plain index directory (or legacy pickle) at the root still reads as before.
+FORMAT_NAME = "tile-vector-index"
+FORMAT_VERSION = 1
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.npy"
+KEYS_FILE = "keys.json"
+ROWS_FILE = "rows.json"
+# Per-row arrays needed at serve time, stored next to vectors.npy rather than in rows.json
+ARRAY_FILES = {"hashes": "hashes.npy", "digests": "digests.npy"}
+CURRENT_FILE = "CURRENT"
+BUILD_LOCK_FILE = ".build.lock"
+VERSIONS_DIR = "versions"
+
+
+def is_index_dir(path):
+    return bool(path) and os.path.isfile(os.path.join(path, HEADER_FILE))
+
+
+def index_stamp(path):
+    """Cheap change token: stat of the header (directories) or of the file (legacy pickles)."""
+    target = os.path.join(path, HEADER_FILE) if os.path.isdir(path) else path
+    try:
+        st = os.stat(target)
+    except (FileNotFoundError, TypeError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _write_json(path, obj):
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, default=str)
+
+
+def hash_array(hashes):
+    """Per-row hashes (ints, legacy '0'/'1' strings or None) -> uint64 array, 0 where missing."""
+    if isinstance(hashes, np.ndarray):
+        return hashes
+    return np.array([hash_from_bits(h) or 0 for h in hashes], dtype=np.uint64)
+
+
+def hash_list(hashes):
+    """Inverse of hash_array: int or None per row."""
+    if isinstance(hashes, np.ndarray):
+        return [int(h) or None for h in hashes.tolist()]
+    return [hash_from_bits(h) for h in hashes]
+
+
+def digest_array(digests):
+    """Per-row hex digests (or None) -> fixed-width bytes array, b"" where missing."""
+    if isinstance(digests, np.ndarray):
+        return digests
+    return np.array([(d or "").encode("ascii") for d in digests], dtype=bytes)
+
+
+def digest_list(digests):
+    """Inverse of digest_array: str or None per row."""
+    if isinstance(digests, np.ndarray):
+        return [d.decode("ascii") or None for d in digests.tolist()]
+    return list(digests)
+
+
+def write_index(path, names, vectors, model, rows=None):
+    """
+    Write an index directory. `vectors` must already be L2-normalized.
+    `hashes` / `digests` in `rows` go to their own .npy files, the rest to
+    rows.json. Each file is replaced atomically and the header goes last, so
+    readers keyed on the header never pick up a half-written index. Returns
+    the header.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(names):
+        raise ValueError(f"vectors shape {vectors.shape} does not match {len(names)} keys")
+
+    rows = dict(rows or {})
+    arrays = {}
+    if rows.get("hashes") is not None:
+        arrays["hashes"] = hash_array(rows.pop("hashes"))
+    if rows.get("digests") is not None:
+        arrays["digests"] = digest_array(rows.pop("digests"))
+
+    os.makedirs(path, exist_ok=True)
+    with atomic_write(os.path.join(path, VECTORS_FILE)) as f:
+        np.save(f, vectors)
+    for name, array in arrays.items():
+        with atomic_write(os.path.join(path, ARRAY_FILES[name])) as f:
+            np.save(f, array)
+    _write_json(os.path.join(path, KEYS_FILE), list(names))
+    _write_json(os.path.join(path, ROWS_FILE), rows)
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "id": uuid.uuid4().hex,  # ties derived files (e.g. compressed codes) to this build
+        "model": model,
+        "dim": int(vectors.shape[1]),
+        "count": int(vectors.shape[0]),
+        "dtype": "float32",
+        "normalized": True,
+        "arrays": sorted(arrays),  # per-row .npy files present (see ARRAY_FILES)
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    _write_json(os.path.join(path, HEADER_FILE), header)
+    return header
+
+
+def read_index(path, mmap=True, rows=True):
+    """
+    Open an index as a dict with `names`, `features` and `header`, plus any
+    per-row metadata (hashes, digests and, with `rows`, the builder's
+    etags, last_modified and skipped). Serving processes pass `rows=False`
+    and never parse rows.json. A versioned root reads its CURRENT version.
+    Directories are memory-mapped; legacy joblib pickles (a
+    `(names, features)` tuple or a dict) are loaded into memory with
+    `header["normalized"] = False`.
+    """
+    path = resolve_index_dir(path)
+    if not is_index_dir(path):
+        payload = joblib.load(path)
+        if not isinstance(payload, dict):
+            names, features = payload
+            payload = {"names": list(names), "features": features}
+        payload["header"] = {"format": "legacy-pickle", "id": None, "model": None, "normalized": False}
+        return payload
+
+    with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME or header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format in {path}: {header.get('format')} v{header.get('version')}")
+
+    mmap_mode = "r" if mmap else None
+    features = np.load(os.path.join(path, VECTORS_FILE), mmap_mode=mmap_mode)
+    with open(os.path.join(path, KEYS_FILE), "r", encoding="utf-8") as f:
+        names = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+        for name, filename in ARRAY_FILES.items()
+        if os.path.isfile(os.path.join(path, filename))
+    }
+
+    payload = {}
+    # Indexes written before the .npy arrays existed keep hashes/digests in rows.json
+    if rows or "arrays" not in header:
+        try:
+            with open(os.path.join(path, ROWS_FILE), "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            pass
+        if not rows:
+            payload = {name: payload[name] for name in ARRAY_FILES if name in payload}
+    payload.update(arrays)
+
+    if not (len(names) == features.shape[0] == header["count"]) or features.shape[1] != header["dim"]:
+        raise ValueError(f"Index {path} is inconsistent (header/keys/vectors disagree); is a write in progress?")
+    if any(len(payload[name]) != len(names) for name in ARRAY_FILES if payload.get(name) is not None):
+        raise ValueError(f"Index {path} is inconsistent (per-row arrays disagree with keys)")
+
+    payload.update({"names": names, "features": features, "header": header})
+    return payload
+
+
+def convert_legacy_index(pickle_path, out_path, model):
+    """Convert a joblib `(names, feature_matrix)` pickle into a new version of the index root `out_path`."""
+    payload = read_index(pickle_path)
+    features = np.asarray(payload["features"], dtype=np.float32)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    rows = {k: payload[k] for k in ("etags", "last_modified", "hashes", "digests", "skipped") if k in payload}
+    with build_lock(out_path):
+        version = new_version_name()
+        write_index(new_version_dir(out_path, version), payload["names"], features / norms, model, rows=rows)
+        publish_version(out_path, version)
+    return len(payload["names"])
+
+
+# -----------------------
+# 🔹 Versioned index roots
+# -----------------------
+def resolve_index_dir(path):
+    """
+    Directory to read for `path`: the version CURRENT points at for a
+    versioned root, else `path` itself (plain index directory or legacy pickle).
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except (FileNotFoundError, NotADirectoryError, TypeError):
+        return path
+    return os.path.join(path, VERSIONS_DIR, name) if name else path
+
+
+def new_version_name():
+    """
+    Build name that sorts by creation time (UTC, to the nanosecond), so
+    list_versions / prune_versions order two builds in the same second
+    correctly. One build uses the same name in every root it writes.
+    """
+    seconds, nanos = divmod(time.time_ns(), 1_000_000_000)
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(seconds))}-{nanos:09d}"
+
+
+def new_version_dir(path, name):
+    version_dir = os.path.join(path, VERSIONS_DIR, name)
+    os.makedirs(version_dir, exist_ok=True)
+    return version_dir
+
+
+def list_versions(path):
+    """Complete version names under a versioned root, oldest first."""
+    try:
+        names = os.listdir(os.path.join(path, VERSIONS_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if is_index_dir(os.path.join(path, VERSIONS_DIR, name)))
+
+
+def current_version(path):
+    """Name of the live version, or None if `path` is not a versioned root."""
+    resolved = resolve_index_dir(path)
+    return os.path.basename(resolved) if resolved != path else None
+
+
+def publish_version(path, name, keep=None):
+    """
+    Make version `name` the live index of `path`. CURRENT is replaced
+    atomically, so readers see the old or the new version, never a mix; a
+    snapshot already loaded keeps its (memory-mapped) files. With `keep`,
+    all but the `keep` newest other versions are deleted.
+    """
+    if not is_index_dir(os.path.join(path, VERSIONS_DIR, name)):
+        raise ValueError(f"{path} has no complete version {name!r}")
+    with atomic_write(os.path.join(path, CURRENT_FILE), "w", encoding="utf-8") as f:
+        f.write(name)
+    if keep is not None:
+        prune_versions(path, keep)
+
+
+def prune_versions(path, keep):
+    """
+    Delete all but the `keep` newest complete versions besides the live one,
+    plus partial builds older than the live one (abandoned by a failed build).
+    """
+    current = current_version(path)
+    others = [name for name in list_versions(path) if name != current]
+    doomed = others[:max(0, len(others) - keep)]
+    try:
+        names = os.listdir(os.path.join(path, VERSIONS_DIR))
+    except FileNotFoundError:
+        names = []
+    complete = set(list_versions(path))
+    doomed += [name for name in names if name not in complete and current and name < current]
+    for name in doomed:
+        shutil.rmtree(os.path.join(path, VERSIONS_DIR, name), ignore_errors=True)
+
+
+@contextmanager
+def build_lock(path, blocking=True):
+    """
+    Exclusive lock on the root `path` for the duration of a build, so two
+    builders (watchers in several processes, the CLI, a cold start) never
+    write, publish or prune the same root at once. Yields True once held;
+    with `blocking=False` yields False instead of waiting for another build.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, BUILD_LOCK_FILE), "w") as lock_file:
+        try:
+            import fcntl
+        except ImportError:
+            yield True  # no flock on this platform; builds are not serialized
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,221 @@
+import os
+import json
+import threading
+import numpy as np
+from config import (
+    INFERENCE_CHANNELS_LAST,
+    INFERENCE_INTEROP_THREADS,
+    INFERENCE_THREADS,
+    MODEL_EXPORT_DIR,
+)
+
+# -----------------------
+# 🔹 CPU inference backends
+# -----------------------
+# One encoder (ResNet18 features, CLIP text, CLIP image) behind a callable
+# `runner(batch_tensor) -> (n, dim) float32 array`, served by:
+#   eager       - the PyTorch module as-is
+#   int8        - torch dynamic quantization of nn.Linear layers (CLIP's
+#                 transformers; ResNet18 has none once fc is dropped)
+#   torchscript - traced, frozen and optimized TorchScript
+#   onnx        - ONNX Runtime session
+#   onnx-int8   - ONNX Runtime over a dynamically quantized graph
+# Exported files live in MODEL_EXPORT_DIR next to a json naming the model tag
+# they came from, so a model change re-exports instead of serving stale weights.
+#
+# The matchers (image_matcher, clip_matcher) import torch and build their
+# models and encoders on first use, so importing them stays cheap; warmup.py
+# loads them before the service reports ready. Each matcher guards its lazy
+# init with one re-entrant lock (the encoder builds the model), so concurrent
+# first requests never load or export the same model twice.
+BACKENDS = ("eager", "int8", "torchscript", "onnx", "onnx-int8")
+
+_EXPORT_SUFFIXES = {"torchscript": ".pt", "onnx": ".onnx", "onnx-int8": ".int8.onnx"}
+
+_threads_lock = threading.Lock()
+_threads_configured = False
+
+
+def configure_threads(threads=INFERENCE_THREADS, interop_threads=INFERENCE_INTEROP_THREADS):
+    """Apply intra-op / inter-op thread counts to torch (once per process; later calls are no-ops)."""
+    global _threads_configured
+    with _threads_lock:
+        if _threads_configured:
+            return
+        _threads_configured = True
+        import torch
+        if threads > 0:
+            torch.set_num_threads(threads)
+        if interop_threads > 0:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as e:
+                # Only allowed before the first parallel op in the process
+                print(f"⚠️ Could not set inter-op threads: {e}")
+
+
+def method_module(model, method):
+    """nn.Module whose forward is `model.<method>` (e.g. CLIP's encode_text), for tracing/export."""
+    import torch
+
+    class _MethodModule(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            return getattr(self.model, method)(x)
+
+    return _MethodModule().eval()
+
+
+def export_path(name, backend, export_dir=None):
+    return os.path.join(export_dir or MODEL_EXPORT_DIR, f"{name}{_EXPORT_SUFFIXES[backend]}")
+
+
+def _meta_path(path):
+    return f"{path}.json"
+
+
+def _is_current(path, model_tag):
+    try:
+        with open(_meta_path(path), "r", encoding="utf-8") as f:
+            return os.path.isfile(path) and json.load(f).get("model") == model_tag
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def _write_meta(path, model_tag, backend):
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({"model": model_tag, "backend": backend}, f)
+
+
+def _tmp_path(path):
+    # pid and thread id: two threads exporting the same encoder never share a file
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+
+
+def export_encoder(name, model_tag, module, example_input, backend, export_dir=None):
+    """Write `module` (eval mode) for `backend`; returns the exported file path."""
+    import torch
+    module = module.cpu()
+    path = export_path(name, backend, export_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = _tmp_path(path)
+
+    if backend == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example_input)
+        torch.jit.save(traced, tmp_path)
+    elif backend == "onnx":
+        with torch.no_grad():
+            torch.onnx.export(
+                module, (example_input,), tmp_path,
+                input_names=["input"], output_names=["output"],
+                dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+                opset_version=17,
+            )
+    elif backend == "onnx-int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        source = export_path(name, "onnx", export_dir)
+        if not _is_current(source, model_tag):
+            export_encoder(name, model_tag, module, example_input, "onnx", export_dir)
+        quantize_dynamic(source, tmp_path, weight_type=QuantType.QInt8)
+    else:
+        raise ValueError(f"Backend {backend!r} has nothing to export")
+
+    os.replace(tmp_path, path)
+    _write_meta(path, model_tag, backend)
+    print(f"📦 Exported {name} ({backend}) to {path}")
+    return path
+
+
+def _to_channels_last(x):
+    import torch
+    return x.contiguous(memory_format=torch.channels_last) if x.dim() == 4 else x
+
+
+class EncoderRunner:
+    """Callable over one backend: batch tensor in, (n, dim) float32 numpy array out."""
+
+    def __init__(self, name, backend, forward, channels_last=False):
+        self.name = name
+        self.backend = backend
+        self._forward = forward
+        self.channels_last = channels_last
+
+    def __call__(self, batch):
+        return np.asarray(self._forward(batch), dtype=np.float32)
+
+
+def _torch_forward(module, channels_last, device="cpu"):
+    import torch
+
+    def forward(batch):
+        batch = batch.to(device)
+        if channels_last:
+            batch = _to_channels_last(batch)
+        with torch.no_grad():
+            return module(batch).float().cpu().numpy()
+    return forward
+
+
+def _onnx_forward(path):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if INFERENCE_THREADS > 0:
+        options.intra_op_num_threads = INFERENCE_THREADS
+    if INFERENCE_INTEROP_THREADS > 0:
+        options.inter_op_num_threads = INFERENCE_INTEROP_THREADS
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    def forward(batch):
+        return session.run(None, {"input": batch.cpu().numpy()})[0]
+    return forward
+
+
+def load_encoder(name, model_tag, build_module, example_input, backend,
+                 channels_last=INFERENCE_CHANNELS_LAST, device="cpu"):
+    """
+    EncoderRunner for `name` on `backend`. `build_module()` returns the eager
+    nn.Module on `device` (only called when it is needed); `example_input` is a
+    CPU batch used for tracing/export. Missing or stale exports are rebuilt on
+    the spot. Every backend except eager runs on the CPU.
+    """
+    import torch
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+    configure_threads()
+
+    if backend in ("onnx", "onnx-int8"):
+        path = export_path(name, backend)
+        if not _is_current(path, model_tag):
+            export_encoder(name, model_tag, build_module(), example_input, backend)
+        runner = EncoderRunner(name, backend, _onnx_forward(path))
+    elif backend == "torchscript":
+        path = export_path(name, backend)
+        if not _is_current(path, model_tag):
+            export_encoder(name, model_tag, build_module(), example_input, backend)
+        module = torch.jit.load(path, map_location="cpu").eval()
+        if channels_last:
+            module = module.to(memory_format=torch.channels_last)
+        try:
+            module = torch.jit.optimize_for_inference(torch.jit.freeze(module))
+        except RuntimeError as e:
+            print(f"⚠️ TorchScript optimization skipped for {name}: {e}")
+        runner = EncoderRunner(name, backend, _torch_forward(module, channels_last), channels_last)
+    else:
+        module = build_module()
+        if backend == "int8":
+            module, device = module.cpu(), "cpu"  # quantized kernels are CPU-only
+            if not any(isinstance(m, torch.nn.Linear) for m in module.modules()):
+                print(f"⚠️ {name} has no Linear layers; int8 dynamic quantization leaves it unchanged")
+            module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        if channels_last:
+            module = module.to(memory_format=torch.channels_last)
+        runner = EncoderRunner(name, backend, _torch_forward(module, channels_last, device), channels_last)
+
+    print(f"✅ {name} encoder ready ({backend}{', channels_last' if channels_last else ''})")
+    return runner
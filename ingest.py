@@ -0,0 +1,84 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+
+# -----------------------
+# 🔹 Pipelined stages
+# -----------------------
+def iter_prefetched(fn, items, workers, max_pending=None):
+    """
+    Run `fn(item)` on a bounded thread pool and yield `(item, result, error)`
+    in input order. At most `max_pending` items are in flight, so a slow
+    consumer (e.g. a model forward pass) applies backpressure to downloads.
+    """
+    max_pending = max_pending or workers * 4
+    pending = deque()
+
+    def pop():
+        item, future = pending.popleft()
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= max_pending:
+                yield pop()
+        while pending:
+            yield pop()
+
+
+def batched(iterable, size):
+    """Group an iterable into lists of at most `size` items."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------
+# 🔹 Throughput reporting
+# -----------------------
+class StageTimer:
+    """
+    Accumulates item counts and busy time per pipeline stage (thread-safe).
+    With a `name`, every timed block is also exported as
+    tile_build_stage_seconds / tile_build_items_total{build=name, stage=...}.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def time(self, stage, count=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                items, seconds = self.stages.get(stage, (0, 0.0))
+                self.stages[stage] = (items + count, seconds + elapsed)
+            if self.name:
+                metrics.build_stage_seconds.observe(elapsed, build=self.name, stage=stage)
+                metrics.build_items_total.inc(count, build=self.name, stage=stage)
+
+    def report(self, label, total_items):
+        wall = time.perf_counter() - self._started
+        print(f"⏱️ {label}: {total_items} images in {wall:.1f}s ({total_items / wall if wall else 0:.1f} img/s overall)")
+        for stage, (items, seconds) in self.stages.items():
+            rate = items / seconds if seconds else 0.0
+            print(f"   • {stage}: {items} items, {seconds:.1f}s busy, {rate:.1f} img/s per worker")
@@ -0,0 +1,191 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# -----------------------
+# 🔹 Prometheus metrics
+# -----------------------
+# Minimal counters, gauges and histograms rendered in the Prometheus text
+# exposition format (served on /metrics). Every metric registers itself in
+# REGISTRY when it is created at module level.
+REGISTRY = []
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values.items()]
+
+
+class Gauge(_Metric):
+    """Set directly, or backed by a callback evaluated at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, fn, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._functions[key] = fn
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue  # a failing callback just drops its sample
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in values.items() if v is not None]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = []
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# -----------------------
+# 🔹 Shared metrics
+# -----------------------
+request_latency = Histogram(
+    "tile_request_latency_seconds", "HTTP request latency by endpoint.", ("endpoint", "method"),
+)
+requests_total = Counter(
+    "tile_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "method", "status"),
+)
+stage_latency = Histogram(
+    "tile_stage_latency_seconds", "Latency of one request-path stage (decode, embed, search, ...).", ("stage",),
+)
+build_stage_seconds = Histogram(
+    "tile_build_stage_seconds", "Busy time per index-build stage and batch.", ("build", "stage"),
+)
+build_items_total = Counter(
+    "tile_build_items_total", "Items processed per index-build stage.", ("build", "stage"),
+)
+index_rows = Gauge("tile_index_rows", "Rows in the loaded index.", ("index",))
+index_bytes = Gauge("tile_index_vector_bytes", "Bytes of the loaded index's full-precision vectors.", ("index",))
+
+
+def span(stage):
+    """Time one request-path stage: `with span("image.embed"): ...`."""
+    return stage_latency.time(stage=stage)
+
+
+def watch_index(name, vector_index):
+    """Row-count and size gauges read from `vector_index`'s current snapshot at scrape time."""
+    def rows():
+        snapshot = vector_index.get()
+        return len(snapshot) if snapshot is not None else None
+
+    def size():
+        snapshot = vector_index.get()
+        return snapshot.vectors.nbytes if snapshot is not None else None
+
+    index_rows.set_function(rows, index=name)
+    index_bytes.set_function(size, index=name)
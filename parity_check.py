@@ -0,0 +1,91 @@
+# parity_check.py
+# Compare an inference backend against the eager models: per-embedding cosine
+# similarity and top-k overlap of index searches run with each embedding.
+#   python parity_check.py --backend onnx --images static/tiles --samples 64
+import os
+import sys
+import argparse
+import numpy as np
+from PIL import Image
+from inference import BACKENDS, load_encoder
+from export_models import ENCODERS, encoder_specs
+from quantization import recall_at_k
+from vector_index import normalize_rows
+
+DEFAULT_TEXTS = [
+    "white marble floor tile",
+    "blue mosaic pool tiles",
+    "grey matt porcelain",
+    "wood effect plank tile",
+    "black and white patterned encaustic",
+    "terracotta hexagon",
+    "glossy green subway tile",
+    "large format concrete look",
+]
+
+
+def sample_images(folder, count):
+    names = sorted(f for f in os.listdir(folder) if f.lower().endswith((".png", ".jpg", ".jpeg")))
+    return [Image.open(os.path.join(folder, name)).convert("RGB") for name in names[:count]]
+
+
+def encoder_inputs(name, images, texts):
+    import torch
+    if name == "resnet18":
+        from image_matcher import preprocess_image
+        return torch.stack([preprocess_image(image) for image in images])
+    from clip_matcher import get_clip_model
+    _, preprocess, tokenizer, _ = get_clip_model()
+    if name == "clip-text":
+        return tokenizer(texts)
+    return torch.stack([preprocess(image) for image in images])
+
+
+def encoder_index(name):
+    if name == "resnet18":
+        from image_matcher import get_image_index
+        return get_image_index()
+    from clip_matcher import get_clip_index
+    return get_clip_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check an inference backend against the eager encoders")
+    parser.add_argument("--backend", required=True, choices=[b for b in BACKENDS if b != "eager"])
+    parser.add_argument("--encoders", nargs="+", default=list(ENCODERS), choices=ENCODERS)
+    parser.add_argument("--images", default="static/tiles", help="folder of sample images")
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail below this embedding cosine")
+    args = parser.parse_args()
+
+    images = sample_images(args.images, args.samples)
+    specs = encoder_specs()
+    failed = False
+    for name in args.encoders:
+        if name != "clip-text" and not images:
+            print(f"⚠️ No sample images in {args.images}; skipping {name}")
+            continue
+        model_tag, build_module, example = specs[name]
+        batch = encoder_inputs(name, images, DEFAULT_TEXTS)
+        eager = load_encoder(name, model_tag, build_module, example, "eager", channels_last=False)
+        candidate = load_encoder(name, model_tag, build_module, example, args.backend)
+
+        expected = normalize_rows(eager(batch))
+        actual = normalize_rows(candidate(batch))
+        cosines = np.sum(expected * actual, axis=1)
+        line = (f"   • {name:10s} {args.backend}: cosine mean {cosines.mean():.5f}, min {cosines.min():.5f}, "
+                f"max |Δ| {np.abs(expected - actual).max():.4f}")
+
+        index = encoder_index(name)
+        if index is not None:
+            expected_ids = [ids for ids, _ in index.search_batch(expected, args.k)]
+            actual_ids = [ids for ids, _ in index.search_batch(actual, args.k)]
+            line += f", top-{args.k} overlap {recall_at_k(expected_ids, actual_ids):.3f}"
+        print(line)
+        failed |= bool(cosines.min() < args.min_cosine)
+
+    if failed:
+        print(f"❌ Embeddings diverge from eager below cosine {args.min_cosine}")
+        sys.exit(1)
+    print("✅ Backend matches eager within tolerance")
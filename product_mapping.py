@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import threading
+from io import BytesIO
+import pandas as pd
+from botocore.exceptions import ClientError
+from fileio import atomic_write
+from s3_store import get_s3_client
+from config import (
+    AWS_BUCKET,
+    PRODUCTS_EXCEL_KEY,
+    PRODUCTS_EXCEL_SHEET,
+    PRODUCT_MAP_TTL,
+    PRODUCT_MAP_CACHE_FILE,
+)
+
+# -----------------------
+# 🔹 Product mapping (Excel)
+# -----------------------
+_product_map = None
+_product_map_etag = None
+_product_map_checked_at = 0.0
+_product_map_generation = 0  # bumped whenever _product_map is replaced
+
+_refresh_lock = threading.Lock()   # one S3 fetch/parse at a time
+_state_lock = threading.Lock()     # guards _background_refresh
+_background_refresh = None
+
+
+def _text_column(df, col):
+    """Column as stripped strings with NaN -> "" (an all-"" column if `col` is missing)."""
+    if col is None:
+        return pd.Series("", index=df.index)
+    values = df[col]
+    return values.where(values.notna(), "").astype(str).str.strip()
+
+
+def parse_product_mapping(df):
+    """
+    Build basename (lowercased, e.g. gp00091_b.jpg) -> { title, slug, sizes, category }
+    from the products sheet. The 'Images' column may hold comma-separated paths;
+    later rows win when a basename appears twice.
+    """
+    # Normalize columns (case-insensitive)
+    cols = {str(c).lower(): c for c in df.columns}
+
+    images_col = cols.get('images', None)
+    title_col = cols.get('product title', None) or cols.get('producttitle', None) or cols.get('title', None)
+    slug_col = cols.get('slug name', None) or cols.get('slugname', None) or cols.get('slug', None)
+    sizes_col = cols.get('sizes', None) or cols.get('size', None) or cols.get('size(s)', None)
+    category_col = cols.get('category', None) or cols.get('categories', None)
+
+    if images_col is None:
+        print("⚠️ Products excel: 'Images' column not found. Product mapping will be empty.")
+        return {}
+
+    frame = pd.DataFrame({
+        "image": df[images_col],
+        "title": _text_column(df, title_col),
+        "slug": _text_column(df, slug_col),
+        "sizes": _text_column(df, sizes_col),
+        "category": _text_column(df, category_col),
+    })
+    frame = frame[frame["image"].notna()]
+
+    # One row per image path, then reduce each path to its lowercased basename
+    frame = frame.assign(image=frame["image"].astype(str).str.split(",")).explode("image")
+    frame["image"] = frame["image"].str.strip()
+    frame = frame[frame["image"] != ""]
+    frame["image"] = frame["image"].str.rsplit("/", n=1).str[-1].str.lower()
+    frame = frame.drop_duplicates("image", keep="last")
+
+    records = frame[["title", "slug", "sizes", "category"]].to_dict("records")
+    return dict(zip(frame["image"], records))
+
+
+def _set_mapping(mapping, etag):
+    global _product_map, _product_map_etag, _product_map_generation
+    _product_map_etag = etag
+    _product_map_generation += 1
+    _product_map = mapping
+
+
+def _load_local_cache():
+    """Parsed mapping persisted by a previous process, so restarts skip the Excel parse."""
+    try:
+        with open(PRODUCT_MAP_CACHE_FILE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        _set_mapping(cached["mapping"], cached.get("etag"))
+        print(f"✅ Loaded cached product mapping for {len(_product_map)} image filenames.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable product mapping cache: {e}")
+
+
+def _save_local_cache(mapping, etag):
+    if not PRODUCT_MAP_CACHE_FILE:
+        return
+    try:
+        with atomic_write(PRODUCT_MAP_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "mapping": mapping}, f)
+    except Exception as e:
+        print(f"⚠️ Could not persist product mapping cache: {e}")
+
+
+def load_product_mapping(force=False):
+    """
+    Refresh the mapping from S3 and return it.
+    Uses a conditional GET (If-None-Match on the last ETag), so an unchanged
+    Excel file costs one 304 round trip and no parsing. `force` ignores the ETag.
+    On failure the previous mapping is kept.
+    """
+    global _product_map_checked_at
+    with _refresh_lock:
+        if _product_map is None and PRODUCT_MAP_CACHE_FILE and not force:
+            _load_local_cache()
+
+        try:
+            request = {"Bucket": AWS_BUCKET, "Key": PRODUCTS_EXCEL_KEY}
+            if not force and _product_map is not None and _product_map_etag:
+                request["IfNoneMatch"] = _product_map_etag
+            try:
+                obj = get_s3_client().get_object(**request)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                    _product_map_checked_at = time.time()
+                    return _product_map
+                raise
+            data = obj["Body"].read()
+
+            # Try sheet named PRODUCTS_EXCEL_SHEET first, else fallback to first sheet
+            try:
+                df = pd.read_excel(BytesIO(data), sheet_name=PRODUCTS_EXCEL_SHEET, engine="openpyxl")
+            except Exception:
+                df = pd.read_excel(BytesIO(data), sheet_name=0, engine="openpyxl")
+
+            mapping = parse_product_mapping(df)
+            _set_mapping(mapping, obj.get("ETag"))
+            _save_local_cache(mapping, _product_map_etag)
+            print(f"✅ Loaded product mapping for {len(mapping)} image filenames from Excel.")
+        except Exception as e:
+            print(f"⚠️ Could not load products excel from S3: {e}")
+            if _product_map is None:
+                _set_mapping({}, None)
+
+        _product_map_checked_at = time.time()
+        return _product_map
+
+
+def _refresh_in_background():
+    global _background_refresh
+    with _state_lock:
+        if _background_refresh is not None and _background_refresh.is_alive():
+            return
+        _background_refresh = threading.Thread(target=load_product_mapping, daemon=True)
+        _background_refresh.start()
+
+
+def get_product_mapping():
+    """
+    Current mapping from memory. Once it is older than PRODUCT_MAP_TTL a
+    background refresh is started and the current mapping is served meanwhile.
+    """
+    if _product_map is None:
+        with _refresh_lock:
+            if _product_map is None and PRODUCT_MAP_CACHE_FILE:
+                _load_local_cache()
+        if _product_map is None:
+            return load_product_mapping()
+    if time.time() - _product_map_checked_at > PRODUCT_MAP_TTL:
+        _refresh_in_background()
+    return _product_map
+
+
+def get_product_mapping_version():
+    """
+    Changes whenever the mapping is replaced. It is the Excel ETag when known,
+    so it stays stable across restarts. Tables derived from the mapping (see
+    records.py) use it as their freshness stamp.
+    """
+    if _product_map_etag:
+        return _product_map_etag
+    return f"local-{_product_map_generation}"
+
+
+def get_product_info_for_filename(filename):
+    """
+    filename: basename (e.g. 'GP00091_b.jpg') or full key.
+    Returns tuple (title, slug, sizes, category). Returns empty strings if not found.
+    """
+    mapping = get_product_mapping()
+    key = os.path.basename(filename).lower()
+    info = mapping.get(key)
+    if info:
+        return (
+            info.get("title", "") or "",
+            info.get("slug", "") or "",
+            info.get("sizes", "") or "",
+            info.get("category", "") or ""
+        )
+    return "", "", "", ""
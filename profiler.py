@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# -----------------------
+# 🔹 Sampling profiler for slow requests
+# -----------------------
+# While enabled, one daemon thread samples the Python stack of every thread
+# that is serving a request (sys._current_frames) every `interval_ms`. When
+# a request finishes slower than `threshold_ms`, its samples are written as
+# collapsed stacks ("frame;frame;frame count" lines, the input format of
+# flamegraph.pl / speedscope) to `out_dir`. Fast requests just drop theirs.
+
+
+def _collapse(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms, interval_ms=5, out_dir="profiles"):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.out_dir = out_dir
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self.profiles_written = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+    def start(self):
+        """Begin sampling the calling thread."""
+        self._ensure_started()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def stop(self, elapsed, label):
+        """Stop sampling the calling thread; dump its samples if `elapsed` seconds is slow."""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed < self.threshold:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{int(elapsed * 1000)}ms.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.profiles_written += 1
+        print(f"🐢 Slow request {label} ({elapsed * 1000:.0f} ms): profile written to {path}")
+        return path
+
+    def discard(self):
+        """Stop sampling the calling thread without writing anything (no-op if not sampling)."""
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
@@ -0,0 +1,219 @@
+import os
+import numpy as np
+from fileio import atomic_write
+
+# Rows scored per chunk when decoding compressed codes (bounds temporary memory)
+_CHUNK_ROWS = 65536
+
+
+# -----------------------
+# 🔹 Codecs
+# -----------------------
+class Float16Codec:
+    """Half-precision copy of the vectors: 2 bytes per dimension."""
+
+    kind = "float16"
+
+    def train(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, codes, queries):
+        """Approximate scores for a (m, dim) block of queries -> (m, n)."""
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], _CHUNK_ROWS):
+            block = codes[start:start + _CHUNK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        return out
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        return self
+
+
+class Int8Codec:
+    """
+    Per-dimension scalar quantization to uint8: v ≈ low + scale * code.
+    Scores are computed without decoding: q·v ≈ q·low + (q * scale)·code.
+    """
+
+    kind = "int8"
+
+    def __init__(self):
+        self.low = None
+        self.scale = None
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        span = vectors.max(axis=0) - self.low
+        self.scale = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def scores(self, codes, queries):
+        offset = queries @ self.low
+        weights = queries * self.scale
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], _CHUNK_ROWS):
+            block = codes[start:start + _CHUNK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = weights @ block.T + offset[:, None]
+        return out
+
+    def state(self):
+        return {"low": self.low, "scale": self.scale}
+
+    def load_state(self, state):
+        self.low, self.scale = state["low"], state["scale"]
+        return self
+
+
+def _kmeans(x, k, iterations=20, seed=0):
+    """Plain Lloyd's k-means (squared L2) -> (k, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        dists = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * (x @ centroids.T)
+        assign = dists.argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class PQCodec:
+    """
+    Product quantization: the vector is split into `subspaces` chunks, each
+    replaced by the id of its nearest of (up to) 256 k-means centroids, so a
+    row costs `subspaces` bytes. Scores use per-query lookup tables (ADC).
+    """
+
+    kind = "pq"
+
+    def __init__(self, subspaces=64, train_sample=20000):
+        self.subspaces = subspaces
+        self.train_sample = train_sample
+        self.centroids = None  # (subspaces, k, sub_dim)
+
+    def _split(self, vectors):
+        n, dim = vectors.shape
+        if dim % self.subspaces:
+            raise ValueError(f"PQ subspaces ({self.subspaces}) must divide the vector dim ({dim})")
+        return vectors.reshape(n, self.subspaces, dim // self.subspaces)
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > self.train_sample:
+            rows = np.random.default_rng(0).choice(len(vectors), self.train_sample, replace=False)
+            vectors = vectors[np.sort(rows)]
+        parts = self._split(vectors)
+        self.centroids = np.stack([_kmeans(parts[:, m], 256) for m in range(self.subspaces)])
+        return self
+
+    def encode(self, vectors):
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(vectors), _CHUNK_ROWS):
+            parts = self._split(np.asarray(vectors[start:start + _CHUNK_ROWS], dtype=np.float32))
+            for m in range(self.subspaces):
+                c = self.centroids[m]
+                dists = (c ** 2).sum(axis=1)[None, :] - 2.0 * (parts[:, m] @ c.T)
+                codes[start:start + len(parts), m] = dists.argmin(axis=1)
+        return codes
+
+    def scores(self, codes, queries):
+        # lut[q, m, c] = <query q's chunk m, centroid c of subspace m>
+        lut = np.einsum("qmd,mcd->qmc", self._split(queries), self.centroids)
+        sub = np.arange(self.subspaces)
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], _CHUNK_ROWS):
+            block = codes[start:start + _CHUNK_ROWS].astype(np.intp)
+            for qi in range(queries.shape[0]):
+                out[qi, start:start + len(block)] = lut[qi][sub, block].sum(axis=1)
+        return out
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    def load_state(self, state):
+        self.centroids = state["centroids"]
+        self.subspaces = self.centroids.shape[0]
+        return self
+
+
+def make_codec(kind, pq_subspaces=64):
+    if kind == "float16":
+        return Float16Codec()
+    if kind == "int8":
+        return Int8Codec()
+    if kind == "pq":
+        return PQCodec(subspaces=pq_subspaces)
+    raise ValueError(f"Unknown index compression: {kind}")
+
+
+# -----------------------
+# 🔹 Persistence next to an index directory
+# -----------------------
+def _codes_paths(index_dir, kind):
+    return os.path.join(index_dir, f"codec_{kind}.npz"), os.path.join(index_dir, f"codes_{kind}.npy")
+
+
+def load_codes(index_dir, index_id, kind, pq_subspaces=64):
+    """
+    Codec + codes saved by build_codes as codec_<kind>.npz / codes_<kind>.npy
+    inside `index_dir`, or None if they are missing or belong to another
+    build (they are tied to the index's header id).
+    """
+    if not index_dir:
+        return None
+    state_path, codes_path = _codes_paths(index_dir, kind)
+    codec = make_codec(kind, pq_subspaces)
+    try:
+        with np.load(state_path) as saved:
+            if str(saved["index_id"]) != str(index_id):
+                return None
+            codec.load_state({k: saved[k] for k in saved.files if k != "index_id"})
+        return codec, np.load(codes_path)
+    except (FileNotFoundError, KeyError):
+        return None
+
+
+def build_codes(index_dir, index_id, vectors, kind, pq_subspaces=64):
+    """
+    Train a codec on `vectors` and encode them, persisting both inside
+    `index_dir` (`None` keeps them in memory only). Runs at index build time;
+    serving processes only load_codes.
+    """
+    codec = make_codec(kind, pq_subspaces)
+    print(f"🔧 Training {kind} codec for {len(vectors)} vectors...")
+    codec.train(vectors)
+    codes = codec.encode(vectors)
+
+    if index_dir:
+        state_path, codes_path = _codes_paths(index_dir, kind)
+        try:
+            with atomic_write(codes_path) as f:
+                np.save(f, codes)
+            with atomic_write(state_path) as f:
+                np.savez(f, index_id=np.array(str(index_id)), **codec.state())
+        except OSError as e:
+            print(f"⚠️ Could not persist {kind} codes in {index_dir}: {e}")
+    return codec, codes
+
+
+# -----------------------
+# 🔹 Recall
+# -----------------------
+def recall_at_k(exact_ids, approx_ids):
+    """Mean fraction of each query's exact top-k found in its approximate top-k."""
+    hits = [len(set(map(int, e)) & set(map(int, a))) / max(len(e), 1) for e, a in zip(exact_ids, approx_ids)]
+    return float(np.mean(hits)) if hits else 0.0
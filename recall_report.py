@@ -0,0 +1,46 @@
+# recall_report.py
+# Recall@k of the compressed first pass (with and without exact re-ranking)
+# against exact search, using perturbed index rows as queries.
+#   python recall_report.py --index tile_index --k 20 --queries 200
+import time
+import argparse
+import numpy as np
+from config import INDEX_DIR, RERANK_FACTOR, PQ_SUBSPACES
+from index_store import read_index
+from quantization import make_codec, recall_at_k
+from vector_index import IndexSnapshot, normalize_rows, top_k_indices
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report recall@k of compressed index search")
+    parser.add_argument("--index", default=INDEX_DIR, help="index directory (or legacy .pkl)")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05, help="gaussian noise added to query rows")
+    parser.add_argument("--codecs", default="float16,int8,pq")
+    args = parser.parse_args()
+
+    payload = read_index(args.index, mmap=False, rows=False)
+    vectors = normalize_rows(payload["features"])
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = normalize_rows(vectors[rows] + rng.normal(0, args.noise, (len(rows), vectors.shape[1])))
+
+    exact = IndexSnapshot(payload["names"], vectors)
+    exact_ids = [exact.search(q, args.k)[0] for q in queries]
+    print(f"📊 {len(vectors)} rows × {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    for kind in args.codecs.split(","):
+        codec = make_codec(kind, PQ_SUBSPACES).train(vectors)
+        codes = codec.encode(vectors)
+        first_pass = [top_k_indices(s, args.k) for s in codec.scores(codes, queries)]
+
+        snapshot = IndexSnapshot(payload["names"], vectors, codec, codes, RERANK_FACTOR)
+        start = time.perf_counter()
+        reranked = [snapshot.search(q, args.k)[0] for q in queries]
+        per_query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        print(f"   • {kind:8s} {codes.nbytes / 1e6:8.1f} MB codes "
+              f"(full: {vectors.nbytes / 1e6:.1f} MB)  "
+              f"recall@{args.k}: first pass {recall_at_k(exact_ids, first_pass):.3f}, "
+              f"reranked ×{RERANK_FACTOR} {recall_at_k(exact_ids, reranked):.3f}  "
+              f"({per_query_ms:.2f} ms/query)")
@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+from config import AWS_URL, BASE_URL
+from fileio import atomic_write
+from index_store import is_index_dir
+from product_mapping import get_product_mapping, get_product_mapping_version
+
+# -----------------------
+# 🔹 Per-row response records
+# -----------------------
+# records.json sits in an index directory: one ready-to-serve dict per index
+# row (S3 URL, filename, product title/URL, sizes, category), stamped with
+# the index id and the product mapping version it was built from. A search
+# response is then a gather of rows plus scores instead of per-match
+# product lookups and URL formatting.
+RECORDS_FILE = "records.json"
+
+
+def build_records(names, mapping):
+    """One response record per index row (everything except the score)."""
+    records = []
+    for key in names:
+        basename = os.path.basename(key)
+        info = mapping.get(basename.lower()) or {}
+        slug = info.get("slug", "") or ""
+        records.append({
+            "url": f"{AWS_URL}/{key}",
+            "filename": basename,
+            "productName": info.get("title") or None,
+            "productUrl": f"{BASE_URL.rstrip('/')}/products/{slug.lstrip('/')}" if slug else None,
+            "sizes": info.get("sizes", "") or "",
+            "category": info.get("category", "") or "",
+        })
+    return records
+
+
+def write_records(index_dir, index_id, names):
+    """Build records.json for a freshly written index from the current product mapping."""
+    mapping = get_product_mapping()
+    records = build_records(names, mapping)
+    _save(index_dir, index_id, get_product_mapping_version(), records)
+    return records
+
+
+def _save(index_dir, index_id, mapping_version, records):
+    try:
+        with atomic_write(os.path.join(index_dir, RECORDS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"index_id": index_id, "mapping_version": mapping_version, "records": records}, f)
+    except OSError as e:
+        print(f"⚠️ Could not persist response records in {index_dir}: {e}")
+
+
+def _load(index_dir, index_id, mapping_version):
+    try:
+        with open(os.path.join(index_dir, RECORDS_FILE), "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if payload.get("index_id") != index_id or payload.get("mapping_version") != mapping_version:
+        return None
+    return payload["records"]
+
+
+class ResponseRecords:
+    """
+    Records for the snapshots of one index directory. The table is rebuilt
+    (and re-persisted) when the snapshot or the product mapping changes, not
+    per request.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self._current = None  # ((snapshot version, mapping version), records)
+        self._lock = threading.Lock()
+
+    def table(self, snapshot):
+        get_product_mapping()  # keeps the mapping's TTL refresh going
+        stamp = (snapshot.version, get_product_mapping_version())
+        current = self._current
+        if current is None or current[0] != stamp:
+            with self._lock:
+                current = self._current
+                if current is None or current[0] != stamp:
+                    current = (stamp, self._load_or_build(snapshot, stamp[1]))
+                    self._current = current
+        return current[1]
+
+    def _load_or_build(self, snapshot, mapping_version):
+        # records.json lives next to the snapshot's own files (its version
+        # directory) and is matched on the snapshot version (the header id), so
+        # a legacy-pickle snapshot never picks up a directory's records
+        index_dir = snapshot.source or self.index_dir
+        persist = is_index_dir(index_dir)
+        if persist:
+            records = _load(index_dir, snapshot.version, mapping_version)
+            if records is not None and len(records) == len(snapshot):
+                return records
+        records = build_records(snapshot.names, get_product_mapping())
+        if persist:
+            _save(index_dir, snapshot.version, mapping_version, records)
+        print(f"🧾 Built {len(records)} response records for {index_dir}")
+        return records
+
+    def refresh(self, snapshot):
+        """Rebuild now (e.g. from the watcher) so no request pays for it."""
+        if snapshot is not None:
+            self.table(snapshot)
+
+    def gather(self, snapshot, matches):
+        """[(row, score)] -> response dicts."""
+        if snapshot is None or not matches:
+            return []
+        table = self.table(snapshot)
+        return [dict(table[row], score=float(score)) for row, score in matches]
@@ -1,4 +1,96 @@
-from image_matcher import build_image_index
+# reindex.py
+# Rebuild the catalog indexes into a new version and publish it (see index_store).
+#   python reindex.py                -> full rebuild
+#   python reindex.py --update       -> only new/changed images (what the web watcher runs;
+#                                       skipped if another build is running, unless --wait)
+#   python reindex.py --list         -> versions on disk, the live one marked
+#   python reindex.py --rollback V   -> point both indexes back at version V
+#   python reindex.py --prepare      -> build codes / FAISS index for the live versions
+import os
+import sys
+import argparse
+import subprocess
+from config import (
+    CLIP_INDEX_DIR,
+    INDEX_BUILD_NICE,
+    INDEX_BUILD_THREADS,
+    INDEX_DIR,
+    INGEST_CLIP_INDEX,
+)
+from index_store import build_lock, current_version, list_versions, publish_version, resolve_index_dir
+
+ROOTS = [INDEX_DIR, CLIP_INDEX_DIR] if INGEST_CLIP_INDEX else [INDEX_DIR]
+
+
+def run_in_subprocess(full=False, wait=False):
+    """
+    Run an index update in a separate, low-priority process so the build
+    never competes with request threads for the GIL. Blocks until it exits;
+    returns True if it published a new version. Without `wait` the update is
+    skipped if another build holds the lock; with it, it runs after that one.
+    """
+    before = resolve_index_dir(INDEX_DIR)
+    env = dict(os.environ, INFERENCE_POOL_WORKERS="0")
+    if INDEX_BUILD_THREADS > 0:
+        for var in ("INFERENCE_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            env[var] = str(INDEX_BUILD_THREADS)
+    command = [sys.executable, os.path.abspath(__file__), "--nice", str(INDEX_BUILD_NICE)]
+    if not full:
+        command.append("--update")
+    if wait:
+        command.append("--wait")
+    result = subprocess.run(command, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"index build process exited with code {result.returncode}")
+    return resolve_index_dir(INDEX_DIR) != before
+
+
+def list_index_versions():
+    for root in ROOTS:
+        live = current_version(root)
+        print(f"📂 {root}")
+        for name in list_versions(root):
+            print(f"   {'*' if name == live else ' '} {name}")
+
+
+def rollback(version):
+    for root in ROOTS:
+        # Waits for a running build, so its publish and prune can't race this one
+        with build_lock(root):
+            if version not in list_versions(root):
+                print(f"⚠️ {root} has no version {version}, left at {current_version(root)}")
+                continue
+            publish_version(root, version)
+        print(f"⏪ {root} → {version}")
+
 
 if __name__ == "__main__":
-    build_image_index()
+    parser = argparse.ArgumentParser(description="Rebuild and publish the catalog indexes")
+    parser.add_argument("--update", action="store_true", help="only embed new/changed images")
+    parser.add_argument("--wait", action="store_true",
+                        help="with --update, wait for a running build instead of skipping")
+    parser.add_argument("--nice", type=int, default=0, help="lower this process's CPU priority first")
+    parser.add_argument("--list", action="store_true", help="list index versions")
+    parser.add_argument("--rollback", metavar="VERSION", help="publish an existing version")
+    parser.add_argument("--prepare", action="store_true",
+                        help="build the configured compressed codes / FAISS index for the live versions")
+    args = parser.parse_args()
+
+    if args.list:
+        list_index_versions()
+        sys.exit(0)
+    if args.rollback:
+        rollback(args.rollback)
+        sys.exit(0)
+    if args.prepare:
+        from vector_index import prepare_live_index
+        for root in ROOTS:
+            prepare_live_index(root)
+        sys.exit(0)
+
+    if args.nice:
+        os.nice(args.nice)
+    from image_matcher import update_image_index
+    # Only the watcher's periodic --update skips (rather than queues) behind
+    # another build; a manual full rebuild waits for the lock
+    update_image_index(rebuild=not args.update, wait=args.wait or not args.update)
@@ -1,3 +1,6 @@
 # reindex_clip.py
-from clip_matcher import build_clip_index
-build_clip_index()
+# The CLIP index is written by the same single S3 pass as the ResNet index
+# (same keys, same order); clip_matcher.build_clip_index still indexes a
+# local folder if that is what you want.
+from image_matcher import build_image_index
+build_image_index(with_clip=True)
@@ -0,0 +1,152 @@
+import time
+import random
+import threading
+from collections import namedtuple
+import boto3
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import (
+    BotoCoreError,
+    NoCredentialsError,
+    PartialCredentialsError,
+    ClientError,
+)
+from image_cache import get_image_cache
+from ingest import iter_prefetched
+from config import (
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    AWS_DEFAULT_REGION,
+    AWS_BUCKET,
+    S3_FOLDER,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_MAX_ATTEMPTS,
+    S3_DOWNLOAD_WORKERS,
+    S3_RETRY_BACKOFF,
+)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+S3Object = namedtuple("S3Object", ["key", "etag", "size", "last_modified"])
+
+# -----------------------
+# 🔹 S3 Client
+# -----------------------
+def init_s3_client():
+    """Create the client and verify access with a one-key listing."""
+    try:
+        session = boto3.session.Session(
+            aws_access_key_id=AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            region_name=AWS_DEFAULT_REGION,
+        )
+        # Connection pool sized for concurrent downloads; botocore retries throttling/5xx
+        s3 = session.client("s3", config=BotoConfig(
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+        ))
+        # test connection (small call)
+        s3.list_objects_v2(Bucket=AWS_BUCKET, Prefix=S3_FOLDER, MaxKeys=1)
+        print(f"✅ Connected to S3 bucket: {AWS_BUCKET}/{S3_FOLDER}")
+        return s3
+    except (NoCredentialsError, PartialCredentialsError):
+        raise RuntimeError("❌ AWS credentials not configured properly")
+    except ClientError as e:
+        raise RuntimeError(f"❌ AWS Client error: {e}")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """Shared client, created (and connection-tested) on first use rather than at import."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = init_s3_client()
+    return _s3_client
+
+def reset_s3_client():
+    """Drop the shared client so the next call reconnects (e.g. after credentials or endpoint change)."""
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = None
+
+# -----------------------
+# 🔹 Inventory
+# -----------------------
+def iter_inventory(client=None, bucket=None, prefix=None, extensions=IMAGE_EXTENSIONS):
+    """
+    Stream every image object under `prefix`, following ContinuationToken
+    across listing pages. Yields S3Object(key, etag, size, last_modified).
+    """
+    client = client or get_s3_client()
+    paginator = client.get_paginator("list_objects_v2")
+    pages = paginator.paginate(Bucket=bucket or AWS_BUCKET, Prefix=S3_FOLDER if prefix is None else prefix)
+    for page in pages:
+        for item in page.get("Contents", []):
+            key = item["Key"]
+            if extensions and not key.lower().endswith(extensions):
+                continue
+            yield S3Object(
+                key=key,
+                etag=item.get("ETag", "").strip('"'),
+                size=item.get("Size"),
+                last_modified=item.get("LastModified"),
+            )
+
+# -----------------------
+# 🔹 Downloads
+# -----------------------
+def download_bytes(key, client=None, bucket=None, attempts=None, backoff=None):
+    """
+    GET one object. The request itself is retried by botocore (standard
+    mode, S3_MAX_ATTEMPTS), so a ClientError here is final; only a body
+    stream that breaks mid-read is re-requested, with jittered backoff.
+    """
+    client = client or get_s3_client()
+    attempts = attempts or S3_MAX_ATTEMPTS
+    backoff = S3_RETRY_BACKOFF if backoff is None else backoff
+
+    for attempt in range(1, attempts + 1):
+        obj = client.get_object(Bucket=bucket or AWS_BUCKET, Key=key)
+        try:
+            return obj["Body"].read()
+        except (BotoCoreError, OSError):
+            if attempt == attempts:
+                raise
+        time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+
+def fetch_bytes(key, etag=None, client=None, bucket=None, timer=None):
+    """
+    Object bytes from the local image cache (see image_cache.py) when
+    `etag` is known and cached, else downloaded (and cached).
+    """
+    cache = get_image_cache() if etag else None
+    if cache is not None:
+        if timer is not None:
+            with timer.time("cache_read"):
+                data = cache.get(key, etag)
+        else:
+            data = cache.get(key, etag)
+        if data is not None:
+            return data
+
+    if timer is not None:
+        with timer.time("download"):
+            data = download_bytes(key, client=client, bucket=bucket)
+    else:
+        data = download_bytes(key, client=client, bucket=bucket)
+    return cache.put(key, etag, data) if cache is not None else data
+
+def iter_downloads(keys, process=None, workers=None, client=None, bucket=None, timer=None, etags=None):
+    """
+    Download `keys` concurrently (at most `workers` requests in flight) and
+    yield `(key, result, error)` in input order. `process(key, data)` runs on
+    the worker thread, so decoding overlaps with other downloads. Keys with
+    an entry in `etags` ({key: ETag}) are served from the local image cache.
+    """
+    def fetch(key):
+        data = fetch_bytes(key, etags.get(key) if etags else None, client=client, bucket=bucket, timer=timer)
+        return process(key, data) if process else data
+
+    return iter_prefetched(fetch, keys, workers or S3_DOWNLOAD_WORKERS)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Flat modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BUCKET = "catalog"
+
+
+@pytest.fixture
+def moto_s3(monkeypatch):
+    """boto3 S3 client on an in-process S3 (moto) with an empty BUCKET."""
+    boto3 = pytest.importorskip("boto3")
+    pytest.importorskip("moto")
+    try:
+        from moto import mock_aws
+    except ImportError:  # moto < 5
+        from moto import mock_s3 as mock_aws
+
+    for var, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                       ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(var, value)
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
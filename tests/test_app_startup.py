@@ -0,0 +1,31 @@
+# tests/test_app_startup.py
+# Background work started by importing app.py:
+#   python -m pytest tests/test_app_startup.py
+import multiprocessing
+import threading
+
+import pytest
+
+for module in ("flask", "flask_cors", "numpy", "PIL", "boto3", "joblib"):
+    pytest.importorskip(module)
+
+
+def _background_threads(results):
+    # Runs in a spawned child, like an inference pool worker importing the app module
+    import app  # noqa: F401
+    results.put(sorted(t.name for t in threading.enumerate() if t.name in ("s3-watcher", "warmup")))
+
+
+def test_spawned_worker_does_not_start_watcher(monkeypatch):
+    # Without warm-up the watcher would start right at import, so a missing guard shows up at once
+    monkeypatch.setenv("WARMUP_ON_START", "0")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=_background_threads, args=(results,))
+    child.start()
+    try:
+        assert results.get(timeout=120) == []
+    finally:
+        child.join(timeout=10)
+        if child.is_alive():
+            child.terminate()
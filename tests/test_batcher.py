@@ -0,0 +1,55 @@
+# tests/test_batcher.py
+# MicroBatcher result and error fan-out:
+#   python -m pytest tests/test_batcher.py
+import pytest
+
+from batcher import MicroBatcher
+
+
+def _batch(batch_fn, items):
+    """Submit `items` back to back; the wait window puts them in one batch."""
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=len(items), max_wait_ms=500)
+    return batcher, [batcher.submit(item) for item in items]
+
+
+def test_results_go_to_their_own_futures():
+    _, futures = _batch(lambda items: [item * 10 for item in items], [1, 2, 3])
+
+    assert [future.result(timeout=5) for future in futures] == [10, 20, 30]
+
+
+def test_batch_error_reaches_every_future():
+    def fail(items):
+        raise ValueError("model exploded")
+
+    _, futures = _batch(fail, [1, 2, 3])
+
+    for future in futures:
+        with pytest.raises(ValueError, match="model exploded"):
+            future.result(timeout=5)
+
+
+@pytest.mark.parametrize("returned", [[], [1], [1, 2, 3, 4]])
+def test_wrong_result_count_fails_every_future(returned):
+    _, futures = _batch(lambda items: returned, [1, 2, 3])
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="returned"):
+            future.result(timeout=5)
+
+
+def test_batcher_keeps_serving_after_a_failed_batch():
+    calls = []
+
+    def flaky(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise ValueError("first batch fails")
+        return [item + 1 for item in items]
+
+    batcher, futures = _batch(flaky, [1, 2])
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+    assert batcher(41) == 42
@@ -0,0 +1,177 @@
+# tests/test_catalog_update.py
+# ETag-diff catalog updates (image_matcher.update_image_index) against an
+# in-process S3 (moto). The ResNet forward pass is replaced by the image's
+# 8x8 RGB pixels, so the tests need no model weights: an all-black image
+# embeds to a zero (blank) vector and colour variants of one pattern share
+# a perceptual hash but not a vector.
+#   python -m pytest tests/test_catalog_update.py
+from io import BytesIO
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("pandas")
+pytest.importorskip("joblib")
+
+import image_matcher
+import records
+import s3_store
+from conftest import BUCKET
+from index_store import read_index
+from vector_index import VectorIndex
+
+PREFIX = "tiles/"
+
+
+def _png(pattern, colour=(255, 255, 255)):
+    """32x32 PNG: `colour` where the 4x4 `pattern` (rows of 0/1) is set, black elsewhere."""
+    cells = np.array(pattern, dtype=np.uint8).repeat(8, axis=0).repeat(8, axis=1)
+    pixels = cells[:, :, None] * np.array(colour, dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+CHECKER = [[1, 0, 1, 0], [0, 1, 0, 1], [1, 0, 1, 0], [0, 1, 0, 1]]
+STRIPES = [[1, 1, 1, 1], [0, 0, 0, 0], [1, 1, 1, 1], [0, 0, 0, 0]]
+CORNER = [[1, 1, 0, 0], [1, 1, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+BLANK = [[0] * 4] * 4
+
+
+class Catalog:
+    """The mocked bucket plus the index roots an update writes to."""
+
+    def __init__(self, client, index_dir):
+        self.client = client
+        self.index_dir = index_dir
+        self.embedded = []  # keys' tensors passed to the fake forward pass, per call
+
+    def put(self, name, data):
+        self.client.put_object(Bucket=BUCKET, Key=PREFIX + name, Body=data)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=BUCKET, Key=PREFIX + name)
+
+    def update(self):
+        return image_matcher.update_image_index(with_clip=False)
+
+    def names(self):
+        return [key[len(PREFIX):] for key in read_index(self.index_dir)["names"]]
+
+    def vector(self, name):
+        payload = read_index(self.index_dir)
+        return np.asarray(payload["features"][payload["names"].index(PREFIX + name)])
+
+    def skipped(self):
+        return {key[len(PREFIX):]: entry for key, entry in read_index(self.index_dir)["skipped"].items()}
+
+
+@pytest.fixture
+def catalog(moto_s3, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "tile_index")
+    catalog = Catalog(moto_s3, index_dir)
+
+    monkeypatch.setattr(s3_store, "_s3_client", moto_s3)
+    monkeypatch.setattr(s3_store, "AWS_BUCKET", BUCKET)
+    monkeypatch.setattr(s3_store, "S3_FOLDER", PREFIX)
+    monkeypatch.setattr(s3_store, "get_image_cache", lambda: None)
+    monkeypatch.setattr(records, "get_product_mapping", lambda: {})
+    monkeypatch.setattr(records, "get_product_mapping_version", lambda: "test")
+    monkeypatch.setattr(image_matcher, "INDEX_DIR", index_dir)
+    monkeypatch.setattr(image_matcher, "_image_index", VectorIndex(index_dir))
+
+    def preprocess(image, crop_to_center=False):
+        return np.asarray(image.resize((8, 8)), dtype=np.float32).reshape(-1)
+
+    def forward(tensors):
+        catalog.embedded.append(len(tensors))
+        return np.vstack(tensors)
+
+    monkeypatch.setattr(image_matcher, "preprocess_image", preprocess)
+    monkeypatch.setattr(image_matcher, "extract_features_batch", forward)
+    return catalog
+
+
+def test_add_change_and_delete(catalog):
+    catalog.put("a.png", _png(CHECKER))
+    catalog.put("b.png", _png(STRIPES))
+    assert catalog.update()
+    assert catalog.names() == ["a.png", "b.png"]
+
+    # Nothing changed: no new version, nothing downloaded or embedded
+    catalog.embedded.clear()
+    assert not catalog.update()
+    assert catalog.embedded == []
+
+    before = catalog.vector("b.png")
+    catalog.put("b.png", _png(CORNER))
+    catalog.put("c.png", _png(STRIPES, (0, 0, 255)))
+    catalog.delete("a.png")
+    catalog.embedded.clear()
+    assert catalog.update()
+    assert catalog.names() == ["b.png", "c.png"]
+    assert sum(catalog.embedded) == 2
+    assert not np.allclose(catalog.vector("b.png"), before)
+
+
+def test_colour_variants_sharing_a_hash_are_both_kept(catalog):
+    catalog.put("red.png", _png(CHECKER, (255, 0, 0)))
+    catalog.put("green.png", _png(CHECKER, (0, 255, 0)))
+    assert image_matcher.compute_hash(_png(CHECKER, (255, 0, 0))) == image_matcher.compute_hash(
+        _png(CHECKER, (0, 255, 0)))
+
+    assert catalog.update()
+    assert catalog.names() == ["green.png", "red.png"]
+    assert catalog.skipped() == {}
+
+
+def test_skipped_duplicate_is_embedded_once_its_original_is_gone(catalog):
+    catalog.put("a.png", _png(CHECKER))
+    catalog.put("a_copy.png", _png(CHECKER))
+    assert catalog.update()
+    assert catalog.names() == ["a.png"]
+    assert catalog.skipped()["a_copy.png"]["reason"] == "duplicate"
+    assert catalog.skipped()["a_copy.png"]["duplicate_of"] == PREFIX + "a.png"
+
+    # Still a duplicate of a live row: not downloaded again
+    catalog.embedded.clear()
+    assert not catalog.update()
+    assert catalog.embedded == []
+
+    catalog.delete("a.png")
+    assert catalog.update()
+    assert catalog.names() == ["a_copy.png"]
+    assert catalog.skipped() == {}
+
+
+def test_blank_images_stay_skipped(catalog):
+    catalog.put("a.png", _png(CHECKER))
+    catalog.put("blank.png", _png(BLANK))
+    assert catalog.update()
+    assert catalog.names() == ["a.png"]
+    assert catalog.skipped()["blank.png"]["reason"] == "blank"
+
+    catalog.embedded.clear()
+    assert not catalog.update()
+    assert catalog.embedded == []
+    assert catalog.skipped()["blank.png"]["reason"] == "blank"
+
+
+def test_deleting_every_image_publishes_an_empty_index(catalog):
+    catalog.put("a.png", _png(CHECKER))
+    catalog.put("b.png", _png(STRIPES))
+    assert catalog.update()
+
+    catalog.delete("a.png")
+    catalog.delete("b.png")
+    assert catalog.update()
+    assert catalog.names() == []
+    snapshot = image_matcher._image_index.get()
+    assert snapshot is not None and len(snapshot) == 0
+    assert image_matcher.find_best_match_rows(_png(CHECKER)) == (snapshot, [])
+
+
+def test_empty_bucket_publishes_nothing(catalog):
+    assert not catalog.update()
+    assert image_matcher._image_index.get() is None
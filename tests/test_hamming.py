@@ -0,0 +1,75 @@
+# tests/test_hamming.py
+# HammingIndex lookups against a brute-force scan:
+#   python -m pytest tests/test_hamming.py
+import random
+
+import pytest
+
+from hamming import HASH_BITS, HammingIndex, hamming_distance
+
+
+def _flip(h, bits):
+    for bit in bits:
+        h ^= 1 << bit
+    return h
+
+
+def _catalog(rng, n=400, clusters=40):
+    """Random hashes, many of them a few bits away from a shared centre."""
+    centres = [rng.getrandbits(HASH_BITS) for _ in range(clusters)]
+    hashes = []
+    for i in range(n):
+        if i % 3 == 0:
+            hashes.append(rng.getrandbits(HASH_BITS))
+        else:
+            hashes.append(_flip(rng.choice(centres), rng.sample(range(HASH_BITS), rng.randint(0, 6))))
+    return hashes
+
+
+def _brute_force(hashes, h, radius):
+    hits = [(hamming_distance(h, stored), item) for item, stored in enumerate(hashes)
+            if hamming_distance(h, stored) <= radius]
+    return [(item, distance) for distance, item in sorted(hits)]
+
+
+@pytest.mark.parametrize("radius", [0, 1, 2, 3, 5, 8])
+def test_near_matches_brute_force(radius):
+    rng = random.Random(radius)
+    hashes = _catalog(rng)
+    index = HammingIndex(radius)
+    for item, h in enumerate(hashes):
+        index.add(h, item)
+
+    queries = hashes[::7] + [_flip(h, rng.sample(range(HASH_BITS), radius + 1)) for h in hashes[::11]]
+    queries += [rng.getrandbits(HASH_BITS) for _ in range(50)]
+    for h in queries:
+        expected = _brute_force(hashes, h, radius)
+        if radius == 0:
+            # Exact mode reports the first value added under the hash
+            expected = expected[:1]
+        assert index.near(h) == expected
+
+
+@pytest.mark.parametrize("radius", [0, 2, 4])
+def test_find_prefers_exact_then_closest(radius):
+    rng = random.Random(100 + radius)
+    hashes = _catalog(rng)
+    index = HammingIndex(radius)
+    for item, h in enumerate(hashes):
+        index.add(h, item)
+
+    for h in hashes[::5] + [rng.getrandbits(HASH_BITS) for _ in range(50)]:
+        expected = _brute_force(hashes, h, radius)
+        assert index.find(h) == (expected[0][0] if expected else None)
+
+
+def test_bands_cover_every_bit():
+    # The pigeonhole argument needs radius + 1 disjoint bands spanning all 64 bits
+    for radius in range(0, 70):
+        index = HammingIndex(radius)
+        covered = 0
+        for shift, mask in index._bands:
+            band = mask << shift
+            assert covered & band == 0
+            covered |= band
+        assert covered == (1 << HASH_BITS) - 1
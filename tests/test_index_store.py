@@ -0,0 +1,118 @@
+# tests/test_index_store.py
+# Versioned index roots: publish, prune, rollback and the build lock:
+#   python -m pytest tests/test_index_store.py
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("joblib")
+
+import index_store
+import reindex
+from index_store import (
+    build_lock,
+    current_version,
+    list_versions,
+    new_version_dir,
+    new_version_name,
+    prune_versions,
+    publish_version,
+    read_index,
+    write_index,
+)
+
+
+def _build(root, n, keep=None):
+    """Write and publish a version with `n` rows; returns its name."""
+    name = new_version_name()
+    vectors = np.eye(n, 4, dtype=np.float32)
+    write_index(new_version_dir(root, name), [f"key{i}" for i in range(n)], vectors, "test-model")
+    publish_version(root, name, keep=keep)
+    return name
+
+
+def test_version_names_sort_in_creation_order():
+    names = [new_version_name() for _ in range(200)]
+    assert names == sorted(names)
+    assert len(set(names)) == len(names)
+
+
+def test_publish_switches_what_the_root_reads(tmp_path):
+    root = str(tmp_path / "index")
+    first = _build(root, 2)
+    assert current_version(root) == first
+    assert len(read_index(root)["names"]) == 2
+
+    second = _build(root, 3)
+    assert current_version(root) == second
+    assert read_index(root)["names"] == ["key0", "key1", "key2"]
+    assert list_versions(root) == [first, second]
+
+
+def test_publish_rejects_incomplete_version(tmp_path):
+    root = str(tmp_path / "index")
+    name = new_version_name()
+    new_version_dir(root, name)  # no header: a build still writing
+    with pytest.raises(ValueError):
+        publish_version(root, name)
+    assert current_version(root) is None
+
+
+def test_prune_keeps_live_and_newest_versions(tmp_path):
+    root = str(tmp_path / "index")
+    names = [_build(root, 2) for _ in range(5)]
+    abandoned = new_version_name()
+    new_version_dir(root, abandoned)  # partial build, older than the next live one
+    live = _build(root, 2)
+    in_progress = new_version_name()
+    new_version_dir(root, in_progress)  # partial build newer than the live one
+
+    prune_versions(root, keep=2)
+
+    assert list_versions(root) == names[-2:] + [live]
+    remaining = sorted(os.listdir(os.path.join(root, index_store.VERSIONS_DIR)))
+    assert abandoned not in remaining
+    assert in_progress in remaining
+
+
+def test_rollback_publishes_an_older_version(tmp_path, monkeypatch):
+    root = str(tmp_path / "index")
+    old = _build(root, 2)
+    _build(root, 3)
+    monkeypatch.setattr(reindex, "ROOTS", [root])
+
+    reindex.rollback(old)
+    assert current_version(root) == old
+    assert len(read_index(root)["names"]) == 2
+
+    reindex.rollback("no-such-version")
+    assert current_version(root) == old
+
+
+def test_build_lock_is_exclusive(tmp_path):
+    pytest.importorskip("fcntl")
+    root = str(tmp_path / "index")
+    with build_lock(root) as held:
+        assert held
+        with build_lock(root, blocking=False) as second:
+            assert second is False
+    with build_lock(root, blocking=False) as again:
+        assert again
+
+
+def test_per_row_arrays_skip_rows_json_when_serving(tmp_path):
+    root = str(tmp_path / "index")
+    name = new_version_name()
+    version_dir = new_version_dir(root, name)
+    rows = {"etags": ["a", "b"], "hashes": [5, None], "digests": ["ab" * 16, None], "skipped": {}}
+    write_index(version_dir, ["k0", "k1"], np.eye(2, 4, dtype=np.float32), "test-model", rows=rows)
+    publish_version(root, name)
+
+    serving = read_index(root, rows=False)
+    assert "etags" not in serving
+    assert index_store.hash_list(serving["hashes"]) == [5, None]
+    assert index_store.digest_list(serving["digests"]) == ["ab" * 16, None]
+
+    building = read_index(root)
+    assert building["etags"] == ["a", "b"]
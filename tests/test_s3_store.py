@@ -0,0 +1,83 @@
+# tests/test_s3_store.py
+# s3_store against an in-process S3 (moto):
+#   python -m pytest tests/test_s3_store.py
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+from botocore.exceptions import ClientError, ResponseStreamingError
+
+import s3_store
+from conftest import BUCKET
+
+PREFIX = "images/"
+
+
+@pytest.fixture
+def client(moto_s3):
+    return moto_s3
+
+
+class FlakyBody:
+    """Object body whose stream breaks on read."""
+
+    def read(self):
+        raise ResponseStreamingError(error="connection reset")
+
+
+class FlakyClient:
+    """Wraps a client so the first `failures` get_object bodies break mid-read."""
+
+    def __init__(self, client, failures):
+        self.client = client
+        self.failures = failures
+        self.calls = 0
+
+    def get_object(self, **kwargs):
+        self.calls += 1
+        obj = self.client.get_object(**kwargs)
+        if self.calls <= self.failures:
+            obj["Body"] = FlakyBody()
+        return obj
+
+
+def test_inventory_follows_pages_past_1000_keys(client):
+    for i in range(1203):
+        client.put_object(Bucket=BUCKET, Key=f"{PREFIX}{i:05d}.jpg", Body=b"x")
+    client.put_object(Bucket=BUCKET, Key=f"{PREFIX}notes.txt", Body=b"x")
+    client.put_object(Bucket=BUCKET, Key="elsewhere/00000.jpg", Body=b"x")
+
+    objects = list(s3_store.iter_inventory(client=client, bucket=BUCKET, prefix=PREFIX))
+
+    assert len(objects) == 1203
+    assert len({obj.key for obj in objects}) == 1203
+    assert all(obj.key.startswith(PREFIX) and obj.key.endswith(".jpg") for obj in objects)
+    assert all(obj.etag and not obj.etag.startswith('"') and obj.size == 1 for obj in objects)
+
+
+def test_download_retries_a_broken_body(client):
+    client.put_object(Bucket=BUCKET, Key=f"{PREFIX}a.jpg", Body=b"image")
+    flaky = FlakyClient(client, failures=2)
+
+    data = s3_store.download_bytes(f"{PREFIX}a.jpg", client=flaky, bucket=BUCKET, attempts=3, backoff=0)
+
+    assert data == b"image"
+    assert flaky.calls == 3
+
+
+def test_download_gives_up_after_attempts(client):
+    client.put_object(Bucket=BUCKET, Key=f"{PREFIX}a.jpg", Body=b"image")
+    flaky = FlakyClient(client, failures=5)
+
+    with pytest.raises(ResponseStreamingError):
+        s3_store.download_bytes(f"{PREFIX}a.jpg", client=flaky, bucket=BUCKET, attempts=3, backoff=0)
+    assert flaky.calls == 3
+
+
+def test_download_does_not_retry_client_errors(client):
+    # botocore has already retried transient ones; NoSuchKey must not be re-requested
+    flaky = FlakyClient(client, failures=0)
+
+    with pytest.raises(ClientError):
+        s3_store.download_bytes(f"{PREFIX}missing.jpg", client=flaky, bucket=BUCKET, attempts=3, backoff=0)
+    assert flaky.calls == 1
@@ -1,4 +1,6 @@
 import os
+from io import BytesIO
+from PIL import Image
 from config import ALLOWED_EXTENSIONS
 
 def allowed_file(filename: str) -> bool:
@@ -6,3 +8,16 @@ def allowed_file(filename: str) -> bool:
         return False
     ext = os.path.splitext(filename)[1].lower().lstrip('.')
     return ext in ALLOWED_EXTENSIONS
+
+def open_image(image_input, mode="RGB"):
+    """
+    Decode an image given as a file path, raw bytes, a binary file-like
+    object (e.g. a Flask upload stream) or a PIL image, and convert to `mode`.
+    """
+    if isinstance(image_input, Image.Image):
+        return image_input.convert(mode)
+    if isinstance(image_input, (bytes, bytearray, memoryview)):
+        return Image.open(BytesIO(image_input)).convert(mode)
+    if isinstance(image_input, (str, os.PathLike)) or hasattr(image_input, "read"):
+        return Image.open(image_input).convert(mode)
+    raise ValueError("Unsupported image input type")
@@ -0,0 +1,295 @@
+import os
+import threading
+import numpy as np
+from config import FAISS_INDEX_TYPE, INDEX_COMPRESSION, PQ_SUBSPACES, RERANK_FACTOR, SEARCH_BACKEND
+from index_store import HEADER_FILE, digest_array, hash_array, index_stamp, is_index_dir, read_index, resolve_index_dir
+from quantization import build_codes, load_codes
+
+
+# -----------------------
+# 🔹 Vector helpers
+# -----------------------
+def normalize_rows(matrix):
+    """Return `matrix` as float32 with every row scaled to unit L2 norm (zero rows stay zero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores, k):
+    """Positions of the `k` largest scores, highest first, using a partial sort."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def greedy_dedup(vectors, ranked_rows, max_keep, dedup_threshold, block_size=128):
+    """
+    Keep rows best-first, dropping any row whose cosine similarity to an
+    already kept row is greater than `1 - dedup_threshold`.
+
+    `vectors` must be L2-normalized; `ranked_rows` are row indices in rank
+    order. Each block of `block_size` rows is compared against the kept rows
+    and against itself with one matrix product, so per-row Python work is O(1).
+    Returns the kept row indices in rank order.
+    """
+    limit = 1 - dedup_threshold
+    kept = []
+    kept_vectors = None
+    if max_keep <= 0:
+        return kept
+
+    for start in range(0, len(ranked_rows), block_size):
+        block_rows = np.asarray(ranked_rows[start:start + block_size])
+        block = vectors[block_rows]
+        alive = np.ones(len(block_rows), dtype=bool)
+        if kept_vectors is not None:
+            alive &= (block @ kept_vectors.T).max(axis=1) <= limit
+        if not alive.any():
+            continue
+
+        sims = block @ block.T
+        block_kept = []
+        for i in range(len(block_rows)):
+            if not alive[i]:
+                continue
+            block_kept.append(i)
+            if len(kept) + len(block_kept) >= max_keep:
+                break
+            alive[i + 1:] &= sims[i, i + 1:] <= limit
+
+        kept.extend(int(r) for r in block_rows[block_kept])
+        new_vectors = block[block_kept]
+        kept_vectors = new_vectors if kept_vectors is None else np.vstack([kept_vectors, new_vectors])
+        if len(kept) >= max_keep:
+            break
+
+    return kept
+
+
+# -----------------------
+# 🔹 Resident index
+# -----------------------
+class IndexSnapshot:
+    """
+    Immutable view of one loaded index.
+    Rows are L2-normalized float32, so cosine similarity is a plain dot product.
+    With a codec, the first pass scores compressed codes and the best
+    `k * rerank_factor` candidates are re-scored against the full-precision
+    (usually memory-mapped) rows, so returned scores are always exact.
+    With a `searcher` (e.g. FaissSearcher) the ANN index picks the rows and
+    its inner-product scores are used directly.
+    """
+
+    def __init__(self, names, vectors, codec=None, codes=None, rerank_factor=4, searcher=None, hashes=None,
+                 version=None, source=None, digests=None):
+        self.names = names
+        # Identifies the index build this snapshot was loaded from (header id or file stamp)
+        self.version = version
+        # Directory (or legacy file) it was loaded from
+        self.source = source
+        self.vectors = vectors
+        # Content digest of each row's ingested image bytes (confirms hash matches), or None
+        self.digests = digest_array(digests) if digests is not None else None
+        # Perceptual hashes sorted once (stable, so equal hashes keep row order) for
+        # the exact-match fast path; numpy arrays rather than a per-row dict
+        self._hash_order = self._sorted_hashes = None
+        if hashes is not None and len(hashes):
+            hashes = hash_array(hashes)
+            self._hash_order = np.argsort(hashes, kind="stable")
+            self._sorted_hashes = hashes[self._hash_order]
+        self.codec = codec
+        self.codes = codes
+        self.rerank_factor = rerank_factor
+        self.searcher = searcher
+
+    def __len__(self):
+        return len(self.names)
+
+    def hash_row(self, h):
+        """First row whose perceptual hash is `h`, or None."""
+        if self._hash_order is None or not h:
+            return None
+        h = np.uint64(h)
+        i = int(np.searchsorted(self._sorted_hashes, h))
+        if i < len(self._sorted_hashes) and self._sorted_hashes[i] == h:
+            return int(self._hash_order[i])
+        return None
+
+    def same_digest(self, row, digest):
+        """True if `row`'s ingested image bytes have content digest `digest`."""
+        return digest is not None and self.digests is not None and self.digests[row] == digest.encode("ascii")
+
+    def search(self, query, k, min_score=None):
+        """
+        Top-k rows for a normalized query vector: (row indices, cosine scores),
+        best first, optionally limited to scores >= `min_score`.
+        """
+        q = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        return self.search_batch(q, k, min_score)[0]
+
+    def search_batch(self, queries, k, min_score=None, chunk_size=64):
+        """
+        `search` for a (m, dim) block of normalized queries, scored with one
+        matrix-matrix product per `chunk_size` queries. Returns a list of
+        (row indices, scores) per query.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.vectors.shape[1])
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            block = queries[start:start + chunk_size]
+            if self.searcher is not None:
+                all_scores, all_ids = self.searcher.search(block, k)
+                for ids, scores in zip(all_ids, all_scores):
+                    keep = ids >= 0
+                    if min_score is not None:
+                        keep &= scores >= min_score
+                    results.append((ids[keep], scores[keep]))
+                continue
+
+            if self.codec is None:
+                block_scores = block @ self.vectors.T
+            else:
+                approx = self.codec.scores(self.codes, block)
+
+            for i, q in enumerate(block):
+                if self.codec is None:
+                    rows, scores = None, block_scores[i]
+                else:
+                    # sorted so the gather from a memmap reads pages in order
+                    rows = np.sort(top_k_indices(approx[i], k * self.rerank_factor))
+                    scores = self.vectors[rows] @ q
+                top = top_k_indices(scores, k)
+                if min_score is not None:
+                    top = top[scores[top] >= min_score]
+                results.append((top if rows is None else rows[top], scores[top]))
+        return results
+
+
+def prepare_search_artifacts(index_dir, index_id, vectors, compression=INDEX_COMPRESSION, backend=SEARCH_BACKEND):
+    """
+    Build and save what the configured search mode needs (compressed codes or
+    a FAISS index) next to a freshly written index, so serving processes only
+    load them. Call before the index version is published.
+    """
+    if len(vectors) == 0:
+        return
+    if backend == "faiss":
+        from faiss_indexer import build_and_save_faiss_index
+        build_and_save_faiss_index(index_dir, index_id, vectors)
+    elif compression not in (None, "", "none"):
+        build_codes(index_dir, index_id, vectors, compression, PQ_SUBSPACES)
+
+
+def prepare_live_index(path):
+    """prepare_search_artifacts for the version `path` currently serves (e.g. after changing INDEX_COMPRESSION)."""
+    source = resolve_index_dir(path)
+    if not is_index_dir(source):
+        print(f"⚠️ {path} is not an index directory; nothing to prepare")
+        return
+    payload = read_index(source, rows=False)
+    features = payload["features"]
+    if not (payload["header"].get("normalized") and features.dtype == np.float32):
+        features = normalize_rows(features)
+    prepare_search_artifacts(source, payload["header"].get("id"), features)
+    # A new header mtime makes serving processes reload and pick the artifacts up
+    os.utime(os.path.join(source, HEADER_FILE))
+
+
+class VectorIndex:
+    """
+    Keeps an index (see index_store) resident in memory.
+    Index directories are memory-mapped and used as-is, so worker processes
+    share pages; for a versioned root the version named by CURRENT is used,
+    and a legacy pickle at `legacy_path` if neither exists yet. The source
+    is only re-read when its header/file (or CURRENT) changes on disk, and
+    readers get an immutable snapshot so a reload never affects a query in
+    flight.
+    """
+
+    def __init__(self, path, legacy_path=None, model=None, compression=INDEX_COMPRESSION, backend=SEARCH_BACKEND):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.model = model
+        self.compression = compression if compression not in (None, "", "none") else None
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._snapshot = None
+
+    def source(self):
+        """Path the index is currently read from, or None if nothing exists on disk."""
+        path = resolve_index_dir(self.path)
+        if index_stamp(path) is not None:
+            return path
+        if self.legacy_path and index_stamp(self.legacy_path) is not None:
+            return self.legacy_path
+        return None
+
+    def get(self):
+        """Current snapshot, reloading first if the index changed. None if there is no index."""
+        source = self.source()
+        if source is None:
+            return self._snapshot
+        stamp = (source, index_stamp(source))
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    try:
+                        self._snapshot = self._load(source)
+                        self._stamp = stamp
+                    except Exception as e:
+                        # e.g. a write in progress; keep serving the previous snapshot
+                        print(f"⚠️ Could not load index {source}: {e}")
+        return self._snapshot
+
+    def _load(self, source):
+        payload = read_index(source, rows=False)
+        header = payload["header"]
+        if self.model and header.get("model") and header["model"] != self.model:
+            print(f"⚠️ Index {source} was built with {header['model']}, expected {self.model}")
+
+        features = payload["features"]
+        if not (header.get("normalized") and features.dtype == np.float32):
+            features = normalize_rows(features)
+
+        # Codes / FAISS indexes are built with the index (prepare_search_artifacts),
+        # never here: this runs on the request path. Missing ones mean exact search.
+        index_dir = source if is_index_dir(source) else None
+        codec = codes = searcher = None
+        mode = "exact"
+        if self.backend == "faiss":
+            # Optional dependency: only imported when the FAISS backend is selected
+            from faiss_indexer import FaissSearcher, load_faiss_index
+            faiss_index = load_faiss_index(index_dir, header.get("id"))
+            if faiss_index is not None:
+                searcher = FaissSearcher(faiss_index)
+                mode = f"faiss {FAISS_INDEX_TYPE}"
+            elif len(features):
+                mode = "exact, no prebuilt FAISS index (run reindex.py --prepare)"
+        elif self.compression:
+            loaded = load_codes(index_dir, header.get("id"), self.compression, PQ_SUBSPACES)
+            if loaded is not None:
+                codec, codes = loaded
+                mode = f"{self.compression} first pass"
+            elif len(features):
+                mode = f"exact, no prebuilt {self.compression} codes (run reindex.py --prepare)"
+
+        snapshot = IndexSnapshot(
+            list(payload["names"]), features, codec, codes, RERANK_FACTOR, searcher,
+            hashes=payload.get("hashes"),
+            digests=payload.get("digests"),
+            version=header.get("id") or f"{source}@{index_stamp(source)}",
+            source=source,
+        )
+        print(f"✅ Loaded {len(snapshot)} vectors from {source} ({mode})")
+        return snapshot
@@ -0,0 +1,176 @@
+import time
+import threading
+from PIL import Image
+from config import WARMUP_RETRY_DELAY, WARMUP_RETRY_MAX_DELAY
+
+# -----------------------
+# 🔹 Startup warm-up
+# -----------------------
+# Everything a first request would otherwise pay for (S3 client, product
+# mapping, model weights, first forward passes, index loads) runs here once,
+# phase by phase, before the service reports ready on /ready.
+_state_lock = threading.Lock()
+_timings = {}   # phase -> seconds
+_errors = {}    # phase -> message
+_started_at = None
+_finished_at = None
+_ready = threading.Event()
+
+
+def _s3_client():
+    from s3_store import get_s3_client
+    get_s3_client()
+
+
+def _product_mapping():
+    from product_mapping import load_product_mapping
+    load_product_mapping()
+
+
+def _pool_mode():
+    # With an inference pool the workers hold the models; loading them here too would double memory
+    from worker_pool import get_inference_pool
+    return get_inference_pool() is not None
+
+
+def _resnet_model():
+    if _pool_mode():
+        return
+    from image_matcher import extract_features_batch, get_resnet_model, preprocess_image
+    get_resnet_model()
+    # First forward pass allocates buffers and picks kernels; keep it off the request path
+    extract_features_batch([preprocess_image(Image.new("RGB", (224, 224)))])
+
+
+def _image_index():
+    from image_matcher import get_image_index, image_records
+    image_records.refresh(get_image_index())
+
+
+def _clip_model():
+    if _pool_mode():
+        return
+    from clip_matcher import encode_texts_batch, get_clip_model
+    get_clip_model()
+    encode_texts_batch(["warm-up"])  # bypasses the embedding cache on purpose
+
+
+def _clip_index():
+    from clip_matcher import clip_records, get_clip_index
+    index = get_clip_index()
+    clip_records.refresh(index)
+    if index is None:
+        print("⚠️ No CLIP index found; text search stays unavailable until reindex_clip.py runs")
+
+
+def _inference_pool():
+    from worker_pool import get_inference_pool
+    pool = get_inference_pool()
+    if pool is None:
+        return
+    # Workers load both models before they answer the first ping
+    status = pool.health(timeout=600)
+    if not status["ok"]:
+        raise RuntimeError(f"inference pool not healthy: {status['error']}")
+
+
+PHASES = [
+    ("s3_client", _s3_client),
+    ("product_mapping", _product_mapping),
+    ("resnet_model", _resnet_model),
+    ("image_index", _image_index),
+    ("clip_model", _clip_model),
+    ("clip_index", _clip_index),
+    ("inference_pool", _inference_pool),
+]
+
+
+def _run_phase(name, phase):
+    """Run one phase, recording its timing (and error, if any). True on success."""
+    start = time.perf_counter()
+    error = None
+    try:
+        phase()
+    except Exception as e:
+        print(f"⚠️ Warm-up phase '{name}' failed: {e}")
+        error = str(e)
+    with _state_lock:
+        _timings[name] = round(time.perf_counter() - start, 3)
+        if error is None:
+            _errors.pop(name, None)
+        else:
+            _errors[name] = error
+    print(f"🔥 Warm-up {name}: {_timings[name]:.2f}s")
+    return error is None
+
+
+def _finish():
+    global _finished_at
+    with _state_lock:
+        _finished_at = time.time()
+        total = _finished_at - _started_at
+    _ready.set()
+    print(f"✅ Warm-up finished in {total:.2f}s; service ready")
+
+
+def run_warmup():
+    """
+    Run every phase once, in order, recording per-phase timings. Ready if all
+    succeed; returns the failed (name, phase) pairs for retry_failed().
+    """
+    global _started_at
+    with _state_lock:
+        _started_at = time.time()
+    failed = [(name, phase) for name, phase in PHASES if not _run_phase(name, phase)]
+    if failed:
+        print(f"❌ Warm-up incomplete, retrying: {', '.join(name for name, _ in failed)}")
+    else:
+        _finish()
+    return failed
+
+
+def retry_failed(failed, delay=WARMUP_RETRY_DELAY, max_delay=WARMUP_RETRY_MAX_DELAY):
+    """Retry failed phases (in order) with exponential backoff until all succeed, then report ready."""
+    while failed:
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+        failed = [(name, phase) for name, phase in failed if not _run_phase(name, phase)]
+    if not _ready.is_set():
+        _finish()
+
+
+def start_warmup(then=None):
+    """
+    Run the warm-up on a daemon thread; `then()` runs after the first pass,
+    whatever the outcome, and failed phases keep being retried afterwards.
+    """
+    def run():
+        failed = run_warmup()
+        if then is not None:
+            then()
+        retry_failed(failed)
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def mark_ready():
+    """Report ready without warming up (WARMUP_ON_START disabled)."""
+    _ready.set()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def status():
+    with _state_lock:
+        return {
+            "ready": _ready.is_set(),
+            "started": _started_at is not None,
+            "finished": _finished_at is not None,
+            "elapsed_seconds": round((_finished_at or time.time()) - _started_at, 3) if _started_at else 0.0,
+            "phases": dict(_timings),
+            "errors": dict(_errors),
+        }
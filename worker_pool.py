@@ -0,0 +1,284 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from config import (
+    INFERENCE_POOL_HEALTH_INTERVAL,
+    INFERENCE_POOL_MAX_PENDING,
+    INFERENCE_POOL_THREADS,
+    INFERENCE_POOL_TIMEOUT,
+    INFERENCE_POOL_WORKERS,
+)
+
+# -----------------------
+# 🔹 Process-pool inference
+# -----------------------
+# With INFERENCE_POOL_WORKERS > 0, image decode, hashing, preprocessing and
+# the ResNet/CLIP forward passes run in a fixed pool of worker processes
+# instead of Flask request threads, so they no longer contend on the GIL.
+# Each worker loads both encoders once and pins torch to
+# INFERENCE_POOL_THREADS threads. Scoring stays in the serving process,
+# which holds the memory-mapped indexes.
+
+_IN_WORKER = False
+
+
+class InferencePoolBusy(RuntimeError):
+    """Raised instead of queueing once INFERENCE_POOL_MAX_PENDING tasks are in flight."""
+
+
+# -----------------------
+# 🔹 Worker side
+# -----------------------
+def _init_worker(threads):
+    global _IN_WORKER
+    _IN_WORKER = True
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    from inference import configure_threads
+    configure_threads(threads, 1)
+
+    from image_matcher import get_resnet_encoder, get_transform
+    from clip_matcher import get_clip_encoders
+    get_resnet_encoder()
+    get_transform()
+    get_clip_encoders()
+    print(f"👷 Inference worker {os.getpid()} ready ({threads} torch thread(s))")
+
+
+def _ping():
+    return os.getpid()
+
+
+def _embed_images(datas):
+    """[image bytes] -> [(hash, ResNet features)]; (None, None) for images that can't be decoded."""
+    from image_matcher import compute_hash, extract_features_batch, preprocess_image
+    from utils import open_image
+
+    out = [(None, None)] * len(datas)
+    slots, tensors = [], []
+    for i, data in enumerate(datas):
+        try:
+            image = open_image(data, "RGB")
+            tensors.append(preprocess_image(image, crop_to_center=True))
+        except Exception as e:
+            print(f"⚠️ Error loading image: {e}")
+            continue
+        slots.append(i)
+        out[i] = (compute_hash(image), None)
+    if tensors:
+        for i, features in zip(slots, extract_features_batch(tensors)):
+            out[i] = (out[i][0], features)
+    return out
+
+
+def _embed_texts(texts):
+    from clip_matcher import encode_texts_batch
+    return encode_texts_batch(texts)
+
+
+def _processes(executor):
+    # ProcessPoolExecutor has no public way to reach (or kill) its workers
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+
+def _terminate(executor):
+    processes = _processes(executor)
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+# -----------------------
+# 🔹 Serving side
+# -----------------------
+class InferencePool:
+    """
+    Fixed pool of model-holding worker processes with backpressure (at most
+    `max_pending` tasks in flight, beyond that InferencePoolBusy), restart
+    when a worker dies (BrokenProcessPool) or a task exceeds `timeout`, and
+    a periodic health check that restarts the pool if workers stop
+    answering.
+    """
+
+    def __init__(self, workers, threads=1, max_pending=64, timeout=30.0, health_interval=30.0):
+        self.workers = workers
+        self.threads = threads
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._health_thread = None
+        self._pending = 0
+        self.restarts = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.completed = 0
+        self.last_health = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # spawn: forking a process that already runs torch/boto3 threads is unsafe
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.threads,),
+                )
+                if self._health_thread is None and self.health_interval > 0:
+                    self._health_thread = threading.Thread(target=self._watch_health, name="inference-pool-health", daemon=True)
+                    self._health_thread.start()
+            return self._executor
+
+    def restart(self, reason, broken=None):
+        """Replace the worker processes. With `broken`, only if that executor is still the current one."""
+        with self._lock:
+            if broken is not None and broken is not self._executor:
+                return  # another thread already restarted it
+            executor, self._executor = self._executor, None
+            self.restarts += 1
+        print(f"♻️ Restarting inference pool: {reason}")
+        if executor is not None:
+            _terminate(executor)
+
+    def _run_all(self, fn, arg_lists):
+        """Run `fn(*args)` for every args tuple in parallel across workers; results in order."""
+        acquired = 0
+        try:
+            for _ in arg_lists:
+                if not self._slots.acquire(blocking=False):
+                    with self._lock:
+                        self.rejected += 1
+                    raise InferencePoolBusy(f"{self.max_pending} inference tasks already pending")
+                acquired += 1
+                with self._lock:
+                    self._pending += 1
+
+            for attempt in (1, 2):
+                executor = self._get_executor()
+                try:
+                    futures = [executor.submit(fn, *args) for args in arg_lists]
+                except (BrokenProcessPool, RuntimeError):
+                    # Broken, or shut down by a concurrent restart
+                    self.restart("could not submit to worker processes", executor)
+                    if attempt == 2:
+                        raise
+                    continue
+                deadline = time.monotonic() + self.timeout
+                try:
+                    results = [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+                except (BrokenProcessPool, CancelledError):
+                    # A worker died (or a concurrent restart cancelled our tasks)
+                    self.restart("a worker process died", executor)
+                    if attempt == 2:
+                        raise
+                    continue
+                except FutureTimeout:
+                    # A hung worker keeps its slot busy until it is killed, so
+                    # restart before the slots are released; not retried
+                    with self._lock:
+                        self.timeouts += 1
+                    self.restart(f"inference task exceeded {self.timeout}s", executor)
+                    raise InferencePoolBusy(f"inference timed out after {self.timeout}s; worker pool restarted")
+                with self._lock:
+                    self.completed += len(results)
+                return results
+        finally:
+            with self._lock:
+                self._pending -= acquired
+            for _ in range(acquired):
+                self._slots.release()
+
+    def embed_images(self, datas, chunk_size=16):
+        """[image bytes] -> [(hash, features)], spread over the workers in chunks."""
+        datas = [bytes(data) for data in datas]
+        if not datas:
+            return []
+        chunk_size = max(1, min(chunk_size, -(-len(datas) // self.workers)))
+        chunks = [(datas[i:i + chunk_size],) for i in range(0, len(datas), chunk_size)]
+        return [item for chunk in self._run_all(_embed_images, chunks) for item in chunk]
+
+    def embed_texts(self, texts):
+        """[text] -> (n, dim) CLIP text embeddings, one worker task."""
+        return self._run_all(_embed_texts, [(list(texts),)])[0]
+
+    def health(self, timeout=None):
+        """
+        Check the workers; starts the pool if needed. A dead worker process
+        fails the check. When the pool is idle every worker slot is also
+        pinged; while tasks are in flight a ping would only queue behind them,
+        so liveness is all that is checked (hung tasks trip the per-task
+        timeout instead). The first call waits for the workers to load their
+        models, so give it a `timeout` well above the per-task one.
+        """
+        executor = self._get_executor()
+        timeout = timeout or self.timeout
+        start = time.perf_counter()
+        try:
+            processes = _processes(executor)
+            dead = [process.pid for process in processes if not process.is_alive()]
+            if dead:
+                raise BrokenProcessPool(f"worker process(es) {dead} exited")
+            if self._pending and processes:
+                status = {"ok": True, "workers": sorted(process.pid for process in processes), "busy": True}
+            else:
+                pids = [f.result(timeout=timeout) for f in [executor.submit(_ping) for _ in range(self.workers)]]
+                status = {"ok": True, "workers": sorted(set(pids))}
+        except (BrokenProcessPool, CancelledError, FutureTimeout, RuntimeError) as e:
+            status = {"ok": False, "error": repr(e)}
+            self.restart(f"health check failed: {e!r}", executor)
+        status["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        status["checked_at"] = time.time()
+        self.last_health = status
+        return status
+
+    def _watch_health(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.health()
+            except Exception as e:
+                # Never let one bad check end the watcher
+                print(f"⚠️ Inference pool health check errored: {e!r}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "last_health": self.last_health,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool():
+    """The shared pool if INFERENCE_POOL_WORKERS > 0, else None (always None inside a worker)."""
+    global _pool
+    if INFERENCE_POOL_WORKERS <= 0 or _IN_WORKER:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(
+                    INFERENCE_POOL_WORKERS,
+                    threads=INFERENCE_POOL_THREADS,
+                    max_pending=INFERENCE_POOL_MAX_PENDING,
+                    timeout=INFERENCE_POOL_TIMEOUT,
+                    health_interval=INFERENCE_POOL_HEALTH_INTERVAL,
+                )
+    return _pool